@@ -1,9 +1,14 @@
+import json
+import logging
+import time
+import typing as t
+from collections import Counter
+from contextlib import nullcontext
 from pathlib import Path
-from typing import Literal
 
 import click
 
-from . import service
+from . import profiling, service
 from .errors import ArcToSqliteError
 
 
@@ -26,15 +31,172 @@ from .errors import ArcToSqliteError
     default="daily",
 )
 @click.option("--spatialite", is_flag=True, help="Enable SpatiaLite support.")
+@click.option(
+    "--rtree",
+    is_flag=True,
+    help=(
+        "Add SQLite's built-in R*Tree spatial indexes on the places, timeline "
+        "items and samples. Doesn't need SpatiaLite."
+    ),
+)
+@click.option(
+    "--simplified-paths",
+    is_flag=True,
+    help=(
+        "Also save each timeline item's path simplified at a few levels of "
+        "detail, as encoded polylines."
+    ),
+)
+@click.option(
+    "--partition-samples",
+    is_flag=True,
+    help=(
+        "Save the samples to a table per month, with a samples view of them "
+        "all. Only for new databases, which then stay partitioned."
+    ),
+)
+@click.option(
+    "--compact-keys",
+    is_flag=True,
+    help=(
+        "Key the places, timeline items and samples by integers from a uuids "
+        "table, rather than Arc's UUIDs. Only for new databases, which then "
+        "keep using them."
+    ),
+)
+@click.option(
+    "--date-columns",
+    is_flag=True,
+    help=(
+        "Add generated columns for the timestamps as seconds since the epoch "
+        "and the local dates, with the dates indexed."
+    ),
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of export files to ingest per database transaction.",
+)
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes used to decode and transform export files.",
+)
+@click.option(
+    "--quick-check",
+    is_flag=True,
+    help=(
+        "Skip export files whose size, modification time and inode haven't "
+        "changed since they were processed, without checksumming them."
+    ),
+)
+@click.option(
+    "--bulk-load",
+    is_flag=True,
+    help=(
+        "Drop the indexes and full-text search triggers while importing and "
+        "rebuild them at the end. Faster for large initial backfills."
+    ),
+)
+@click.option(
+    "--pragma-profile",
+    type=click.Choice(service.INGEST_PRAGMA_PROFILES),
+    help=(
+        "SQLite performance settings to use. fast-ingest switches back to "
+        "safe once the import finishes."
+    ),
+)
+@click.option(
+    "--stats-json",
+    type=click.Path(file_okay=True, dir_okay=False, allow_dash=True),
+    help=(
+        "Write the time spent on each stage of processing each export file "
+        "to this JSON file."
+    ),
+)
+@click.option(
+    "--save-stats",
+    is_flag=True,
+    help=(
+        "Save the time spent on each stage of processing each export file to "
+        "the arc_export_files table."
+    ),
+)
+@click.option(
+    "--profile",
+    "profile_path",
+    type=click.Path(file_okay=True, dir_okay=False),
+    help=(
+        "Profile the import and write the results to this file. Worker "
+        "processes aren't profiled."
+    ),
+)
+@click.option(
+    "--profiler",
+    type=click.Choice(profiling.PROFILERS),
+    default="cprofile",
+    show_default=True,
+    help=(
+        "cprofile writes pstats, pyinstrument (if installed) writes collapsed "
+        "stacks for flame graphs."
+    ),
+)
+@click.option(
+    "--trace-sql",
+    is_flag=True,
+    help=(
+        "Log every SQL statement with how long it took and how many rows it "
+        "changed to stderr."
+    ),
+)
 def cli(
     db_path: str,
     arc_root_dir: str,
-    export_type: Literal["daily", "monthly"] = "daily",
+    export_type: t.Literal["daily", "monthly"] = "daily",
     spatialite: bool = False,
+    rtree: bool = False,
+    simplified_paths: bool = False,
+    partition_samples: bool = False,
+    compact_keys: bool = False,
+    date_columns: bool = False,
+    batch_size: int = 1,
+    workers: int = 1,
+    quick_check: bool = False,
+    bulk_load: bool = False,
+    pragma_profile: t.Optional[str] = None,
+    stats_json: t.Optional[str] = None,
+    save_stats: bool = False,
+    profile_path: t.Optional[str] = None,
+    profiler: str = "cprofile",
+    trace_sql: bool = False,
 ):
     """
     Save data from Arc's export to a SQLite database.
     """
+    started_at = time.perf_counter()
+
+    if profile_path is not None:
+        if (
+            profiler == "pyinstrument"
+            and not profiling.check_pyinstrument_support()
+        ):
+            raise click.ClickException(
+                "pyinstrument isn't installed, install it or use --profiler "
+                "cprofile."
+            )
+
+        # Profiles the rest of the command, stopping once it returns.
+        click.get_current_context().with_resource(
+            profiling.profile(Path(profile_path), profiler=profiler)
+        )
+
+    if trace_sql:
+        logging.basicConfig(format="%(message)s")
+        service.sql_logger.setLevel(logging.DEBUG)
     # If spatialite is enabled, we need to ensure the SpatiaLite extension is
     # available.
     if spatialite is True and service.check_spatialite_support() is False:
@@ -44,8 +206,30 @@ def cli(
         )
 
     # Open the SQLite database and build the database structure.
-    db = service.open_database(Path(db_path), use_spatialite=spatialite)
-    service.build_database(db, use_spatialite=spatialite)
+    db = service.open_database(
+        Path(db_path),
+        use_spatialite=spatialite,
+        pragma_profile=pragma_profile,
+        trace_sql=trace_sql,
+    )
+    try:
+        service.build_database(
+            db,
+            use_spatialite=spatialite,
+            use_rtree=rtree,
+            use_simplified_paths=simplified_paths,
+            partition_samples=partition_samples,
+            compact_keys=compact_keys,
+            date_columns=date_columns,
+        )
+    except ArcToSqliteError as error:
+        raise click.ClickException(error.message)
+
+    # A database that was partitioned, used compact keys or had simplified
+    # paths before still does.
+    partition_samples = service.is_samples_partitioned(db)
+    compact_keys = service.uses_compact_keys(db)
+    simplified_paths = service.uses_simplified_paths(db)
 
     # Get the path to the Arc export directory.
     try:
@@ -61,16 +245,143 @@ def cli(
     arc_export_file_paths = list(service.list_arc_export_files(arc_export_path))
     arc_export_file_paths = sorted(arc_export_file_paths, key=lambda p: p.name)
 
+    # Decide which files are new, changed or unchanged before doing any work,
+    # against the arc_export_files table loaded once up front.
+    arc_export_files_index = service.load_arc_export_files_index(db)
     with click.progressbar(
-        arc_export_file_paths,
-        label=f"Processing {export_type} export files",
+        service.plan_arc_export_files(
+            arc_export_file_paths,
+            arc_export_files_index,
+            quick_check=quick_check,
+            workers=workers,
+        ),
+        length=len(arc_export_file_paths),
+        label=f"Checking {export_type} export files",
     ) as bar:
-        for arc_export_file_path in bar:
-            try:
-                service.process_arc_export_file(
-                    db=db,
-                    file_path=arc_export_file_path,
-                    use_spatialite=spatialite,
-                )
-            except ArcToSqliteError as error:
-                raise click.ClickException(error.message)
+        plans = list(bar)
+
+    statuses = Counter(plan.status for plan in plans)
+    click.echo(
+        f"{statuses['new']} new, {statuses['changed']} changed, "
+        f"{statuses['unchanged']} unchanged {export_type} export files."
+    )
+    # Unchanged files that had to be checksummed are recorded, so the quick
+    # check can skip them next time.
+    service.update_arc_export_file_signatures(db, plans, arc_export_files_index)
+
+    # The stats of every file, and the totals of every stage.
+    files_stats = {
+        plan.file_path.name: service.IngestStats(plan.stats.as_dict())
+        for plan in plans
+    }
+    stats = service.IngestStats()
+    for plan in plans:
+        stats.update(plan.stats)
+
+    plans = [plan for plan in plans if plan.status != "unchanged"]
+
+    # The files are decoded and transformed (possibly by a pool of worker
+    # processes) in order, and saved here by the only process writing to the
+    # database. Each batch of files is committed together, if any file in the
+    # batch fails the whole batch is rolled back.
+    prepared_files = service.prepare_arc_export_files(
+        plans,
+        workers=workers,
+        use_spatialite=spatialite,
+        use_simplified_paths=simplified_paths,
+        use_distances=True,
+    )
+
+    # In bulk load mode the indexes are only rebuilt once all of the files
+    # have been saved, and not at all if there are no files to save.
+    bulk_load_context = (
+        service.bulk_load(db) if bulk_load and plans else nullcontext()
+    )
+
+    # The fast-ingest pragma profile is switched back to safe settings even if
+    # the import fails.
+    try:
+        with bulk_load_context, click.progressbar(
+            length=len(plans),
+            label=f"Processing {export_type} export files",
+        ) as bar:
+            for batch in service.chunked(prepared_files, batch_size):
+                with service.transaction(db):
+                    for prepared in batch:
+                        try:
+                            service.save_prepared_arc_export_file(
+                                db,
+                                prepared,
+                                use_spatialite=spatialite,
+                                partition_samples=partition_samples,
+                                compact_keys=compact_keys,
+                                # In bulk load mode the rollups are rebuilt
+                                # once at the end instead.
+                                daily_rollups=not bulk_load,
+                                save_stats=save_stats,
+                            )
+                        except ArcToSqliteError as error:
+                            raise click.ClickException(error.message)
+
+                        files_stats[prepared.plan.file_path.name].update(
+                            prepared.stats
+                        )
+                        stats.update(prepared.stats)
+
+                bar.update(len(batch))
+
+        if bulk_load and plans:
+            with stats.measure("daily_rollups"):
+                service.update_daily_rollups(db)
+    finally:
+        service.finish_pragma_profile(db, pragma_profile)
+
+    elapsed = time.perf_counter() - started_at
+    click.echo(
+        f"Processed {len(plans)} {export_type} export files in "
+        f"{elapsed:.2f}s."
+    )
+    if stats.stages:
+        click.echo(stats.as_table())
+
+    if stats_json is not None:
+        with click.open_file(stats_json, "w") as file_obj:
+            json.dump(
+                {
+                    "elapsed": elapsed,
+                    "stages": stats.as_dict(),
+                    "files": {
+                        file_name: file_stats.as_dict()
+                        for file_name, file_stats in files_stats.items()
+                    },
+                },
+                file_obj,
+                indent=2,
+            )
+
+
+@click.command()
+@click.argument(
+    "db_path",
+    type=click.Path(
+        exists=True, file_okay=True, dir_okay=False, allow_dash=False
+    ),
+    required=True,
+)
+def migrate(db_path: str):
+    """
+    Migrate a database built by an older version of arc-to-sqlite.
+    """
+    if service.check_spatialite_support() is False:
+        raise click.ClickException(
+            "SpatiaLite support is not available. Please ensure the SpatiaLite"
+            " extension is installed and available in the system PATH."
+        )
+
+    db = service.open_database(Path(db_path), use_spatialite=True)
+    versions = service.migrate_database(db)
+
+    if versions:
+        click.echo(f"Migrated the database to version {versions[-1]}.")
+    else:
+        click.echo("The database is already up to date.")
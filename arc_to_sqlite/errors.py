@@ -24,3 +24,16 @@ class ArcExportFilesRowFailedError(ArcToSqliteError):
     """
     Raised when a row fails to be inserted into the database.
     """
+
+
+class DatabaseMigrationRequiredError(ArcToSqliteError):
+    """
+    Raised when the database needs migrating before it can be used.
+    """
+
+
+class IncompatibleOptionsError(ArcToSqliteError):
+    """
+    Raised when options are used together that can't be, or can't be used
+    with the database.
+    """
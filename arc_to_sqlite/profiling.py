@@ -0,0 +1,74 @@
+import cProfile
+import typing as t
+from contextlib import contextmanager
+from pathlib import Path
+
+PROFILERS = ("cprofile", "pyinstrument")
+
+
+def check_pyinstrument_support() -> bool:
+    """
+    Check if the pyinstrument sampling profiler is installed.
+    """
+    try:
+        import pyinstrument  # noqa: F401
+    except ImportError:
+        return False
+
+    return True
+
+
+def format_collapsed_stacks(root_frame: t.Any) -> str:
+    """
+    Format a pyinstrument frame tree as collapsed stacks, one line per stack
+    with the milliseconds spent in it, as read by flamegraph.pl and
+    speedscope.
+    """
+    lines = []
+
+    def walk(frame: t.Any, stack: t.Tuple[str, ...]):
+        stack += (
+            f"{frame.function} ({frame.file_path_short}:{frame.line_no})",
+        )
+        self_time = frame.time - sum(child.time for child in frame.children)
+        if round(self_time * 1000) > 0:
+            lines.append(f"{';'.join(stack)} {round(self_time * 1000)}")
+
+        for child in frame.children:
+            walk(child, stack)
+
+    if root_frame is not None:
+        walk(root_frame, ())
+
+    return "".join(f"{line}\n" for line in lines)
+
+
+@contextmanager
+def profile(output_path: Path, profiler: str = "cprofile") -> t.Iterator[None]:
+    """
+    Profile the block, writing cProfile's stats (to be read with pstats or
+    snakeviz) or pyinstrument's collapsed stacks to the output path.
+
+    Only the current process is profiled, not any worker processes.
+    """
+    if profiler == "pyinstrument":
+        from pyinstrument import Profiler
+
+        sampler = Profiler()
+        sampler.start()
+        try:
+            yield
+        finally:
+            session = sampler.stop()
+            output_path.write_text(
+                format_collapsed_stacks(session.root_frame())
+            )
+        return
+
+    tracer = cProfile.Profile()
+    tracer.enable()
+    try:
+        yield
+    finally:
+        tracer.disable()
+        tracer.dump_stats(output_path)
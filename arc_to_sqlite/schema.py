@@ -0,0 +1,244 @@
+import datetime
+
+ARC_EXPORT_FILES_COLUMNS = {
+    "id": int,
+    "file_name": str,
+    "file_path": str,
+    "file_size": int,
+    "file_mtime_ns": int,
+    "file_inode": int,
+    "file_checksum": str,
+    "export_type": str,
+    "last_processed_at": datetime.datetime,
+    "stats": str,
+}
+
+PLACES_COLUMNS = {
+    "place_id": str,
+    "name": str,
+    "street_address": str,
+    "latitude": float,
+    "longitude": float,
+    "radius_sd": float,
+    "radius_mean": float,
+    "mapbox_place_id": str,
+    "mapbox_category": str,
+    "google_place_id": str,
+    "google_primary_type": str,
+    "seconds_from_gmt": int,
+    "last_saved_at": datetime.datetime,
+    "arc_export_file_id": int,
+    "created_at": datetime.datetime,
+    "updated_at": datetime.datetime,
+}
+
+TIMELINE_ITEMS_COLUMNS = {
+    "item_id": str,
+    "next_item_id": str,
+    "previous_item_id": str,
+    "place_id": str,
+    "starts_at": datetime.datetime,
+    "ends_at": datetime.datetime,
+    "latitude": float,
+    "longitude": float,
+    "altitude": float,
+    "radius_sd": float,
+    "radius_mean": float,
+    "step_count": int,
+    "hk_step_count": int,
+    "floors_ascended": int,
+    "floors_descended": int,
+    "street_address": str,
+    "manual_place": bool,
+    "is_visit": bool,
+    "average_heart_rate": float,
+    "max_heart_rate": int,
+    "active_energy_burned": float,
+    "activity_type": str,
+    "activity_type_confidence_score": float,
+    "manual_activity_type": bool,
+    "uncertain_activity_type": bool,
+    "unknown_activity_type": bool,
+    "seconds_from_gmt": int,
+    "distance": float,
+    "last_saved_at": datetime.datetime,
+    "arc_export_file_id": int,
+    "created_at": datetime.datetime,
+    "updated_at": datetime.datetime,
+}
+
+SAMPLES_COLUMNS = {
+    "sample_id": str,
+    "timeline_item_id": str,
+    "taken_at": datetime.datetime,
+    "latitude": float,
+    "longitude": float,
+    "altitude": float,
+    "recording_state": str,
+    "moving_state": str,
+    "xy_acceleration": float,
+    "z_acceleration": float,
+    "course": float,
+    "course_variance": int,
+    "speed": float,
+    "horizontal_accuracy": float,
+    "vertical_accuracy": float,
+    "step_hz": float,
+    "seconds_from_gmt": int,
+    "last_saved_at": datetime.datetime,
+    "arc_export_file_id": int,
+    "created_at": datetime.datetime,
+    "updated_at": datetime.datetime,
+}
+
+# Which samples partitions each Arc export file saved samples to, when the
+# samples are partitioned.
+ARC_EXPORT_FILE_SAMPLES_PARTITIONS_COLUMNS = {
+    "arc_export_file_id": int,
+    "table_name": str,
+}
+
+# The lookup table of UUIDs to integer ids, with compact keys.
+UUIDS_COLUMNS = {
+    "id": int,
+    "uuid": str,
+}
+
+# The columns of each table holding Arc's UUIDs, which are integer ids from
+# the uuids table with compact keys.
+TABLE_UUID_COLUMNS = {
+    "places": ["place_id"],
+    "timeline_items": [
+        "item_id",
+        "next_item_id",
+        "previous_item_id",
+        "place_id",
+    ],
+    "samples": ["sample_id", "timeline_item_id"],
+}
+
+# The daily rollups of the timeline items, by the local date they started on.
+DAILY_ACTIVITY_COLUMNS = {
+    "day": str,
+    "timeline_item_count": int,
+    "visit_count": int,
+    "step_count": int,
+    "floors_ascended": int,
+    "floors_descended": int,
+    "active_energy_burned": float,
+    "distance": float,
+}
+
+DAILY_PLACE_VISITS_COLUMNS = {
+    "day": str,
+    "place_id": str,
+    "visit_count": int,
+    "duration": int,
+}
+
+# The secondary indexes on each table.
+TABLE_INDEXES = {
+    "arc_export_files": ["file_name"],
+    "places": ["latitude", "longitude"],
+    "timeline_items": [
+        "next_item_id",
+        "previous_item_id",
+        "place_id",
+        "latitude",
+        "longitude",
+        "starts_at",
+        "ends_at",
+        "arc_export_file_id",
+    ],
+    "samples": [
+        "timeline_item_id",
+        "taken_at",
+        "longitude",
+        "latitude",
+        "arc_export_file_id",
+    ],
+}
+
+# Generated columns added with --date-columns, the column type and the
+# expression, for the timestamps as seconds since the epoch and the local date
+# (using seconds_from_gmt) they were on.
+TABLE_DATE_COLUMNS = {
+    "timeline_items": {
+        "starts_at_epoch": (
+            "INTEGER",
+            "CAST(strftime('%s', starts_at) AS INTEGER)",
+        ),
+        "ends_at_epoch": (
+            "INTEGER",
+            "CAST(strftime('%s', ends_at) AS INTEGER)",
+        ),
+        "starts_on": (
+            "TEXT",
+            "date(starts_at, coalesce(seconds_from_gmt, 0) || ' seconds')",
+        ),
+        "ends_on": (
+            "TEXT",
+            "date(ends_at, coalesce(seconds_from_gmt, 0) || ' seconds')",
+        ),
+    },
+    "samples": {
+        "taken_at_epoch": (
+            "INTEGER",
+            "CAST(strftime('%s', taken_at) AS INTEGER)",
+        ),
+        "taken_on": (
+            "TEXT",
+            "date(taken_at, coalesce(seconds_from_gmt, 0) || ' seconds')",
+        ),
+    },
+}
+
+# The indexes on the generated date columns.
+TABLE_DATE_COLUMN_INDEXES = {
+    "timeline_items": ["starts_on", "ends_on"],
+    "samples": ["taken_on"],
+}
+
+# Indexes on the timeline items' local date expressions themselves, which
+# every database gets, so filtering by day uses an index without the date
+# columns too. SQLite only uses them for the exact same expressions.
+TABLE_DATE_EXPRESSION_INDEXES = {
+    "timeline_items": {
+        "idx_timeline_items_starts_on_expr": (
+            TABLE_DATE_COLUMNS["timeline_items"]["starts_on"][1]
+        ),
+        "idx_timeline_items_ends_on_expr": (
+            TABLE_DATE_COLUMNS["timeline_items"]["ends_on"][1]
+        ),
+    },
+}
+
+# The columns of each table indexed for full-text search.
+TABLE_FTS_COLUMNS = {
+    "places": ["name", "street_address"],
+    "timeline_items": ["street_address"],
+}
+
+# The SpatiaLite geometry columns on each table, with --spatialite.
+TABLE_GEOMETRY_COLUMNS = {
+    "places": ["coordinates"],
+    "timeline_items": ["coordinates", "samples_path"],
+    "samples": ["coordinates"],
+}
+
+# The timeline items' simplified samples paths, encoded polyline columns and
+# their Douglas-Peucker tolerances in degrees (about 1 km, 100 m and 10 m).
+SIMPLIFIED_PATH_TOLERANCES = {
+    "samples_polyline_low": 0.01,
+    "samples_polyline_medium": 0.001,
+    "samples_polyline_high": 0.0001,
+}
+
+# The tables that can have an R*Tree index on their latitude and longitude.
+RTREE_TABLES = ["places", "timeline_items", "samples"]
+
+# Stored in the database's user_version pragma, and bumped whenever existing
+# databases need migrating with arc-to-sqlite-migrate.
+#
+# 1. Geometries are x=longitude, y=latitude (they were the other way around).
+SCHEMA_VERSION = 1
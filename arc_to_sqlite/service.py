@@ -1,25 +1,88 @@
 import datetime
 import gzip
 import hashlib
+import itertools
 import json
 import logging
+import math
+import mmap
+import os
+import re
+import sqlite3
+import time
 import typing as t
-from copy import deepcopy
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import contextmanager
 from pathlib import Path
 
-from sqlite_utils.db import Database, Table
+from sqlite_utils.db import Database, Table, jsonify_if_needed
 from sqlite_utils.utils import find_spatialite
 
-from . import errors
+from . import errors, schema
 from .transformers import (
+    convert_coordinates_to_line_strings,
+    convert_coordinates_to_wkb_line_strings,
+    convert_coordinates_to_wkb_points,
+    convert_line_strings_to_simplified_polylines,
+    get_sample_tuple_columns,
     transform_arc_export_file_path,
     transform_place,
-    transform_sample,
+    transform_sample_to_tuple,
     transform_timeline_item,
 )
 
 logger = logging.getLogger(__name__)
 
+# Where the statements are logged with --trace-sql.
+sql_logger = logging.getLogger(f"{__name__}.sql")
+
+# The number of rows looked up or written per statement when working in bulk,
+# kept well below SQLite's limit on the number of variables in a query.
+BULK_BATCH_SIZE = 500
+
+SAMPLES_PARTITION_NAME_RE = re.compile(r"^samples_(\d{4}_\d{2}|undated)$")
+
+# The mean radius of the Earth, in metres.
+EARTH_RADIUS = 6_371_008.8
+
+# Named sets of SQLite pragmas tuned for different workloads. The page_size
+# only takes effect on a new database. read-optimized is for callers that only
+# read the database, like a dashboard opening it with open_database.
+PRAGMA_PROFILES: t.Dict[str, t.Dict[str, t.Union[str, int]]] = {
+    "safe": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+    },
+    "fast-ingest": {
+        "page_size": 16384,
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "cache_size": -256 * 1024,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+    "read-optimized": {
+        "page_size": 16384,
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -64 * 1024,
+        "mmap_size": 1024 * 1024 * 1024,
+        "temp_store": "MEMORY",
+    },
+}
+
+# The profiles that can be used while importing.
+INGEST_PRAGMA_PROFILES = ("safe", "fast-ingest")
+
+# The profiles that aren't safe to leave in place once an import finishes,
+# mapped to the profile they are switched back to.
+PRAGMA_PROFILES_RESTORED_AFTER_INGEST = {"fast-ingest": "safe"}
+
+# The number of timeline items decoded and saved at a time, bounding how much
+# of an export file is held in memory.
+TIMELINE_ITEMS_BATCH_SIZE = 50
+
 
 def check_spatialite_support() -> bool:
     """
@@ -28,11 +91,106 @@ def check_spatialite_support() -> bool:
     return find_spatialite() is not None
 
 
-def open_database(db_file_path: Path, use_spatialite: bool = False) -> Database:
+class ArcConnection(sqlite3.Connection):
+    """
+    A SQLite connection whose context manager can be nested.
+
+    sqlite-utils wraps its writes in ``with db.conn:``, which commits as soon
+    as the block exits. With this connection only the outermost block commits
+    (or rolls back), so many sqlite-utils calls can share one transaction.
+
+    With ``trace_sql`` set every statement is logged to ``sql_logger``, with
+    how long it took and how many rows it changed.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transaction_depth = 0
+        self.trace_sql = False
+
+    def trace(self, method: t.Callable, sql: str, *args) -> sqlite3.Cursor:
+        started_at = time.perf_counter()
+        cursor = method(sql, *args)
+        elapsed = time.perf_counter() - started_at
+
+        # The row count is only known for INSERT, UPDATE and DELETE, and a
+        # SELECT has only run as far as its first row here.
+        sql_logger.debug(
+            "%8.3fms %6s rows  %s",
+            elapsed * 1000,
+            cursor.rowcount if cursor.rowcount >= 0 else "-",
+            " ".join(sql.split()),
+        )
+        return cursor
+
+    def execute(self, sql: str, *args) -> sqlite3.Cursor:
+        if self.trace_sql:
+            return self.trace(super().execute, sql, *args)
+        return super().execute(sql, *args)
+
+    def executemany(self, sql: str, *args) -> sqlite3.Cursor:
+        if self.trace_sql:
+            return self.trace(super().executemany, sql, *args)
+        return super().executemany(sql, *args)
+
+    def executescript(self, sql: str, *args) -> sqlite3.Cursor:
+        if self.trace_sql:
+            return self.trace(super().executescript, sql, *args)
+        return super().executescript(sql, *args)
+
+    def __enter__(self):
+        self.transaction_depth += 1
+        return super().__enter__()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.transaction_depth -= 1
+        if self.transaction_depth > 0:
+            return False
+
+        return super().__exit__(exc_type, exc_value, traceback)
+
+
+def apply_pragma_profile(db: Database, pragma_profile: str):
+    """
+    Set the pragmas of one of the named PRAGMA_PROFILES on the database.
+    """
+    for name, value in PRAGMA_PROFILES[pragma_profile].items():
+        db.execute(f"PRAGMA {name} = {value}")
+
+    logger.info(f"Applied the {pragma_profile} pragma profile.")
+
+
+def finish_pragma_profile(db: Database, pragma_profile: t.Optional[str]):
+    """
+    Once an import has finished, switch away from a pragma profile that isn't
+    safe to leave in place and checkpoint the write-ahead log.
+    """
+    if pragma_profile not in PRAGMA_PROFILES_RESTORED_AFTER_INGEST:
+        return
+
+    apply_pragma_profile(
+        db, PRAGMA_PROFILES_RESTORED_AFTER_INGEST[pragma_profile]
+    )
+    db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+def open_database(
+    db_file_path: Path,
+    use_spatialite: bool = False,
+    pragma_profile: t.Optional[str] = None,
+    trace_sql: bool = False,
+) -> Database:
     """
     Open the Arc SQLite database.
+
+    With ``trace_sql`` every statement run on it is logged to ``sql_logger``.
     """
-    db = Database(db_file_path)
+    conn = sqlite3.connect(str(db_file_path), factory=ArcConnection)
+    conn.trace_sql = trace_sql
+    db = Database(conn)
+
+    if pragma_profile is not None:
+        apply_pragma_profile(db, pragma_profile)
 
     if use_spatialite:
         db.init_spatialite(find_spatialite())
@@ -41,6 +199,32 @@ def open_database(db_file_path: Path, use_spatialite: bool = False) -> Database:
     return db
 
 
+@contextmanager
+def transaction(db: Database) -> t.Iterator[Database]:
+    """
+    Run everything written to the database inside the block in one explicit
+    transaction, committing at the end or rolling back on error.
+
+    The database must have been opened with ``open_database`` (or any other
+    ``ArcConnection``), otherwise sqlite-utils will commit part way through.
+    """
+    with db.conn:
+        if db.conn.in_transaction is False:
+            db.execute("BEGIN")
+        yield db
+
+
+def chunked(
+    items: t.Iterable[t.Any], size: int
+) -> t.Generator[t.List[t.Any], None, None]:
+    """
+    Split an iterable into lists of at most ``size`` items.
+    """
+    iterator = iter(items)
+    while chunk := list(itertools.islice(iterator, size)):
+        yield chunk
+
+
 def get_table(table_name: str, db: Database) -> Table:
     """
     Returns a Table from a given db Database object.
@@ -59,57 +243,673 @@ def create_table_indexes(table: Table, indexes: t.List[str]):
             table.create_index([index])
 
 
-def build_database(db: Database, use_spatialite: bool = False):
+def get_rtree_table_name(table_name: str) -> str:
+    """
+    Get the name of the R*Tree index table for a table.
+    """
+    return f"{table_name}_rtree"
+
+
+def create_rtree_triggers(db: Database, table_name: str):
+    """
+    Create the triggers that keep a table's R*Tree index in sync with its
+    latitude and longitude, keyed by the table's rowid.
+    """
+    rtree_table_name = get_rtree_table_name(table_name)
+    has_coordinates = "new.latitude IS NOT NULL AND new.longitude IS NOT NULL"
+    insert_coordinates = (
+        f"INSERT INTO [{rtree_table_name}] "
+        "SELECT new.rowid, new.longitude, new.longitude, "
+        "new.latitude, new.latitude"
+    )
+
+    db.execute(
+        f"CREATE TRIGGER IF NOT EXISTS [{rtree_table_name}_ai] "
+        f"AFTER INSERT ON [{table_name}] WHEN {has_coordinates} "
+        f"BEGIN {insert_coordinates}; END"
+    )
+    db.execute(
+        f"CREATE TRIGGER IF NOT EXISTS [{rtree_table_name}_ad] "
+        f"AFTER DELETE ON [{table_name}] "
+        f"BEGIN DELETE FROM [{rtree_table_name}] WHERE id = old.rowid; END"
+    )
+    db.execute(
+        f"CREATE TRIGGER IF NOT EXISTS [{rtree_table_name}_au] "
+        f"AFTER UPDATE OF latitude, longitude ON [{table_name}] "
+        "WHEN old.latitude IS NOT new.latitude "
+        "OR old.longitude IS NOT new.longitude "
+        f"BEGIN DELETE FROM [{rtree_table_name}] WHERE id = old.rowid; "
+        f"{insert_coordinates} WHERE {has_coordinates}; END"
+    )
+
+
+def drop_rtree_triggers(db: Database, table_name: str):
+    """
+    Drop the triggers that keep a table's R*Tree index in sync.
+    """
+    rtree_table_name = get_rtree_table_name(table_name)
+    for suffix in ("ai", "ad", "au"):
+        db.execute(f"DROP TRIGGER IF EXISTS [{rtree_table_name}_{suffix}]")
+
+
+def rebuild_rtree_index(db: Database, table_name: str):
+    """
+    Repopulate a table's R*Tree index from the table in one pass.
+    """
+    rtree_table_name = get_rtree_table_name(table_name)
+    db.execute(f"DELETE FROM [{rtree_table_name}]")
+    db.execute(
+        f"INSERT INTO [{rtree_table_name}] "
+        "SELECT rowid, longitude, longitude, latitude, latitude "
+        f"FROM [{table_name}] "
+        "WHERE latitude IS NOT NULL AND longitude IS NOT NULL"
+    )
+
+
+def create_rtree_index(db: Database, table_name: str):
+    """
+    Create an R*Tree index, SQLite's built-in spatial index, on the latitude
+    and longitude of a table. Once created it's kept up to date by triggers.
+    """
+    rtree_table = get_table(get_rtree_table_name(table_name), db=db)
+    if rtree_table.exists():
+        return
+
+    with db.conn:
+        db.execute(
+            f"CREATE VIRTUAL TABLE [{rtree_table.name}] USING rtree("
+            "id, min_longitude, max_longitude, min_latitude, max_latitude)"
+        )
+        rebuild_rtree_index(db, table_name)
+        create_rtree_triggers(db, table_name)
+
+    logger.info(f"Created the {rtree_table.name} table.")
+
+
+def query_bounding_box(
+    db: Database,
+    table_name: str,
+    *,
+    min_latitude: float,
+    min_longitude: float,
+    max_latitude: float,
+    max_longitude: float,
+) -> t.Generator[t.Dict[str, t.Any], None, None]:
+    """
+    Get the rows of a table within a bounding box, using its R*Tree index.
+
+    The R*Tree stores 32-bit floats rounded outwards, so the rows it finds
+    are filtered again on their exact latitude and longitude.
+    """
+    rtree_table_name = get_rtree_table_name(table_name)
+    cursor = db.execute(
+        f"SELECT [{table_name}].* FROM [{table_name}] "
+        f"JOIN [{rtree_table_name}] "
+        f"ON [{rtree_table_name}].id = [{table_name}].rowid "
+        "WHERE min_longitude <= :max_longitude "
+        "AND max_longitude >= :min_longitude "
+        "AND min_latitude <= :max_latitude "
+        "AND max_latitude >= :min_latitude "
+        "AND longitude BETWEEN :min_longitude AND :max_longitude "
+        "AND latitude BETWEEN :min_latitude AND :max_latitude",
+        {
+            "min_latitude": min_latitude,
+            "min_longitude": min_longitude,
+            "max_latitude": max_latitude,
+            "max_longitude": max_longitude,
+        },
+    )
+    columns = [column[0] for column in cursor.description]
+    for row in cursor:
+        yield dict(zip(columns, row))
+
+
+def calculate_distance(
+    latitude: float,
+    longitude: float,
+    other_latitude: float,
+    other_longitude: float,
+) -> float:
+    """
+    Calculate the great-circle distance between two points, in metres.
+    """
+    latitude, longitude, other_latitude, other_longitude = map(
+        math.radians, (latitude, longitude, other_latitude, other_longitude)
+    )
+    a = (
+        math.sin((other_latitude - latitude) / 2) ** 2
+        + math.cos(latitude)
+        * math.cos(other_latitude)
+        * math.sin((other_longitude - longitude) / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS * math.asin(math.sqrt(a))
+
+
+def calculate_path_distance(
+    coordinates: t.Iterable[t.Tuple[t.Any, t.Any]]
+) -> float:
+    """
+    Calculate the length of a path of latitude and longitude pairs, in metres,
+    skipping any pairs missing a latitude or longitude.
+    """
+    distance = 0.0
+    previous = None
+    for latitude, longitude in coordinates:
+        if latitude is None or longitude is None:
+            continue
+
+        if previous is not None:
+            distance += calculate_distance(*previous, latitude, longitude)
+        previous = (latitude, longitude)
+
+    return distance
+
+
+def query_radius(
+    db: Database,
+    table_name: str,
+    *,
+    latitude: float,
+    longitude: float,
+    radius: float,
+) -> t.Generator[t.Dict[str, t.Any], None, None]:
+    """
+    Get the rows of a table within ``radius`` metres of a point, using its
+    R*Tree index to find the rows in the bounding box around the circle.
+    """
+    latitude_delta = math.degrees(radius / EARTH_RADIUS)
+    longitude_delta = math.degrees(
+        radius / (EARTH_RADIUS * max(math.cos(math.radians(latitude)), 1e-9))
+    )
+
+    rows = query_bounding_box(
+        db,
+        table_name,
+        min_latitude=latitude - latitude_delta,
+        min_longitude=longitude - longitude_delta,
+        max_latitude=latitude + latitude_delta,
+        max_longitude=longitude + longitude_delta,
+    )
+    for row in rows:
+        distance = calculate_distance(
+            latitude, longitude, row["latitude"], row["longitude"]
+        )
+        if distance <= radius:
+            yield row
+
+
+def get_table_columns(
+    table_name: str,
+    columns: t.Dict[str, t.Any],
+    compact_keys: bool = False,
+) -> t.Dict[str, t.Any]:
+    """
+    Get the columns to create a table with, where the UUID columns are
+    integers with compact keys.
+    """
+    if compact_keys is False:
+        return columns
+
+    uuid_columns = schema.TABLE_UUID_COLUMNS[table_name]
+    return {
+        column: int if column in uuid_columns else column_type
+        for column, column_type in columns.items()
+    }
+
+
+def create_samples_table(
+    table: Table, use_spatialite: bool = False, compact_keys: bool = False
+):
+    """
+    Create the samples table, or a partition of it.
+    """
+    table.create(
+        columns=get_table_columns(
+            "samples", schema.SAMPLES_COLUMNS, compact_keys=compact_keys
+        ),
+        pk="sample_id",
+        foreign_keys=(
+            ("timeline_item_id", "timeline_items", "item_id"),
+            ("arc_export_file_id", "arc_export_files", "id"),
+        ),
+    )
+
+    if use_spatialite:
+        table.add_geometry_column("coordinates", "GEOMETRY")
+        table.create_spatial_index("coordinates")
+
+    logger.info(f"Created the {table.name} table.")
+
+
+def is_samples_partitioned(db: Database) -> bool:
+    """
+    Check if the database's samples are partitioned, in which case
+    ``samples`` is a view rather than a table.
+    """
+    return "samples" in db.view_names()
+
+
+def get_samples_partition_names(db: Database) -> t.List[str]:
+    """
+    Get the names of the samples partition tables, oldest first.
+    """
+    return sorted(
+        table_name
+        for table_name in db.table_names()
+        if SAMPLES_PARTITION_NAME_RE.match(table_name)
+    )
+
+
+def get_samples_partition_name(taken_at: t.Optional[str]) -> str:
+    """
+    Get the name of the samples partition for when a sample was taken, a
+    table per month (in UTC).
+    """
+    if not taken_at:
+        return "samples_undated"
+
+    return f"samples_{taken_at[:4]}_{taken_at[5:7]}"
+
+
+def refresh_samples_view(db: Database):
+    """
+    Recreate the samples view over all of the samples partitions.
+    """
+    partition_names = get_samples_partition_names(db)
+    if partition_names:
+        select = " UNION ALL ".join(
+            f"SELECT * FROM [{table_name}]" for table_name in partition_names
+        )
+    else:
+        columns = ", ".join(f"NULL AS [{c}]" for c in schema.SAMPLES_COLUMNS)
+        select = f"SELECT {columns} WHERE 0"
+
+    db.execute("DROP VIEW IF EXISTS [samples]")
+    db.execute(f"CREATE VIEW [samples] AS {select}")
+
+
+def create_samples_partition(db: Database, table_name: str):
+    """
+    Create a samples partition table, with the same indexes as the samples
+    table, and add it to the samples view.
+    """
+    table = get_table(table_name, db=db)
+    create_samples_table(table, compact_keys=uses_compact_keys(db))
+    create_table_indexes(table, schema.TABLE_INDEXES["samples"])
+
+    if uses_date_columns(db):
+        add_date_columns(table, "samples")
+    refresh_samples_view(db)
+
+
+def get_all_column_names(table: Table) -> t.List[str]:
+    """
+    Get the names of all of a table's columns, including generated columns
+    which sqlite-utils doesn't list.
+    """
+    return [
+        row[1]
+        for row in table.db.execute(f"PRAGMA table_xinfo([{table.name}])")
+    ]
+
+
+def uses_date_columns(db: Database) -> bool:
+    """
+    Check if the database has the generated date columns.
+    """
+    timeline_items_table = get_table("timeline_items", db=db)
+    return "starts_on" in get_all_column_names(timeline_items_table)
+
+
+def uses_simplified_paths(db: Database) -> bool:
+    """
+    Check if the timeline items have the simplified samples path columns.
+    """
+    columns = get_table("timeline_items", db=db).columns_dict
+    return any(
+        column in columns for column in schema.SIMPLIFIED_PATH_TOLERANCES
+    )
+
+
+def add_date_columns(table: Table, schema_table_name: str):
+    """
+    Add the generated epoch and local date columns, and their indexes, to a
+    table (or a partition of it).
+
+    They are virtual, so they take no space in the table itself and can be
+    added to existing tables, but the local dates are indexed so grouping and
+    filtering by day doesn't evaluate date() on every row.
+    """
+    column_names = get_all_column_names(table)
+
+    date_columns = schema.TABLE_DATE_COLUMNS[schema_table_name]
+    for column, (column_type, expression) in date_columns.items():
+        if column not in column_names:
+            table.db.execute(
+                f"ALTER TABLE [{table.name}] ADD COLUMN [{column}] "
+                f"{column_type} GENERATED ALWAYS AS ({expression}) VIRTUAL"
+            )
+
+    create_table_indexes(
+        table, schema.TABLE_DATE_COLUMN_INDEXES[schema_table_name]
+    )
+
+
+def create_date_expression_indexes(table: Table, schema_table_name: str):
+    """
+    Create the indexes on a table's local date expressions.
+    """
+    indexes = schema.TABLE_DATE_EXPRESSION_INDEXES[schema_table_name]
+    for index_name, expression in indexes.items():
+        table.db.execute(
+            f"CREATE INDEX IF NOT EXISTS [{index_name}] "
+            f"ON [{table.name}] ({expression})"
+        )
+
+
+def get_table_indexes(db: Database, schema_table_name: str) -> t.List[str]:
+    """
+    Get the columns with secondary indexes for a table in the schema.
+    """
+    indexes = list(schema.TABLE_INDEXES[schema_table_name])
+    if (
+        schema_table_name in schema.TABLE_DATE_COLUMN_INDEXES
+        and uses_date_columns(db)
+    ):
+        indexes.extend(schema.TABLE_DATE_COLUMN_INDEXES[schema_table_name])
+
+    return indexes
+
+
+def uses_compact_keys(db: Database) -> bool:
+    """
+    Check if the database uses integer ids from the uuids table rather than
+    Arc's UUIDs for its keys.
+    """
+    return get_table("uuids", db=db).exists()
+
+
+def get_uuid_ids(
+    db: Database, uuids: t.Iterable[t.Optional[str]]
+) -> t.Dict[str, int]:
+    """
+    Get the integer ids of UUIDs from the uuids table, adding any that aren't
+    there yet. Nones are skipped.
+    """
+    unique_uuids = {uuid for uuid in uuids if uuid is not None}
+    if not unique_uuids:
+        return {}
+
+    with db.conn:
+        db.conn.executemany(
+            "INSERT OR IGNORE INTO [uuids] ([uuid]) VALUES (?)",
+            ((uuid,) for uuid in unique_uuids),
+        )
+
+    uuid_ids: t.Dict[str, int] = {}
+    for uuids_chunk in chunked(unique_uuids, BULK_BATCH_SIZE):
+        placeholders = ", ".join("?" for _ in uuids_chunk)
+        uuid_ids.update(
+            db.execute(
+                f"SELECT [uuid], [id] FROM [uuids] "
+                f"WHERE [uuid] IN ({placeholders})",
+                uuids_chunk,
+            ).fetchall()
+        )
+
+    return uuid_ids
+
+
+def create_daily_rollup_tables(db: Database, compact_keys: bool = False):
+    """
+    Create the daily rollup tables, and fill them in from any timeline items
+    that are already saved.
+    """
+    daily_activity_table = get_table("daily_activity", db=db)
+    if daily_activity_table.exists():
+        return
+
+    daily_activity_table.create(columns=schema.DAILY_ACTIVITY_COLUMNS, pk="day")
+
+    daily_place_visits_columns = dict(schema.DAILY_PLACE_VISITS_COLUMNS)
+    if compact_keys:
+        daily_place_visits_columns["place_id"] = int
+
+    get_table("daily_place_visits", db=db).create(
+        columns=daily_place_visits_columns,
+        pk=("day", "place_id"),
+        foreign_keys=(("place_id", "places", "place_id"),),
+    )
+    logger.info("Created the daily rollup tables.")
+
+    update_daily_rollups(db)
+
+
+def get_timeline_item_days(
+    db: Database, item_ids: t.Iterable[t.Any]
+) -> t.Set[str]:
+    """
+    Get the local dates the timeline items started on.
+    """
+    day = schema.TABLE_DATE_COLUMNS["timeline_items"]["starts_on"][1]
+
+    days: t.Set[str] = set()
+    for item_ids_chunk in chunked(item_ids, BULK_BATCH_SIZE):
+        placeholders = ", ".join("?" for _ in item_ids_chunk)
+        days.update(
+            row[0]
+            for row in db.execute(
+                f"SELECT DISTINCT {day} FROM [timeline_items] "
+                f"WHERE [item_id] IN ({placeholders})",
+                item_ids_chunk,
+            )
+            if row[0] is not None
+        )
+
+    return days
+
+
+def update_daily_rollups(
+    db: Database, days: t.Optional[t.Iterable[str]] = None
+):
+    """
+    Recompute the daily rollups for the given local dates, or every day if
+    ``days`` is None.
+
+    Timeline items count towards the day they started on.
+    """
+    day = schema.TABLE_DATE_COLUMNS["timeline_items"]["starts_on"][1]
+
+    where = "TRUE"
+    params: t.List[t.Any] = []
+    if days is not None:
+        days = sorted(days)
+        if not days:
+            return
+
+        # The range on starts_at uses its index, and is a day wider on either
+        # side to allow for time zone offsets.
+        start = datetime.date.fromisoformat(days[0]) - datetime.timedelta(1)
+        end = datetime.date.fromisoformat(days[-1]) + datetime.timedelta(2)
+        placeholders = ", ".join("?" for _ in days)
+        where = (
+            "[starts_at] >= ? AND [starts_at] < ? "
+            f"AND {day} IN ({placeholders})"
+        )
+        params = [start.isoformat(), end.isoformat(), *days]
+
+    with db.conn:
+        for table_name in ("daily_activity", "daily_place_visits"):
+            if days is None:
+                db.execute(f"DELETE FROM [{table_name}]")
+            else:
+                db.execute(
+                    f"DELETE FROM [{table_name}] "
+                    f"WHERE [day] IN ({placeholders})",
+                    days,
+                )
+
+        db.execute(
+            "INSERT INTO [daily_activity] "
+            "([day], [timeline_item_count], [visit_count], [step_count], "
+            "[floors_ascended], [floors_descended], [active_energy_burned], "
+            "[distance]) "
+            f"SELECT {day} AS [day], count(*), sum([is_visit]), "
+            "sum([step_count]), sum([floors_ascended]), "
+            "sum([floors_descended]), sum([active_energy_burned]), "
+            "sum([distance]) "
+            f"FROM [timeline_items] WHERE {where} AND [day] IS NOT NULL "
+            "GROUP BY [day]",
+            params,
+        )
+        db.execute(
+            "INSERT INTO [daily_place_visits] "
+            "([day], [place_id], [visit_count], [duration]) "
+            f"SELECT {day} AS [day], [place_id], count(*), "
+            "sum(strftime('%s', [ends_at]) - strftime('%s', [starts_at])) "
+            f"FROM [timeline_items] WHERE {where} AND [day] IS NOT NULL "
+            "AND [is_visit] AND [place_id] IS NOT NULL "
+            "GROUP BY [day], [place_id]",
+            params,
+        )
+
+
+def get_schema_version(db: Database) -> int:
+    """
+    Get the schema version stored in the database's user_version pragma.
+    """
+    return db.execute("PRAGMA user_version").fetchone()[0]
+
+
+def set_schema_version(db: Database, version: int):
+    """
+    Store the schema version in the database's user_version pragma.
+    """
+    db.execute(f"PRAGMA user_version = {int(version)}")
+
+
+def get_geometry_columns(db: Database) -> t.List[t.Tuple[str, str]]:
+    """
+    Get the (table, column) pairs of the geometry columns in the database.
+    """
+    geometry_columns = []
+    for table_name, column_names in schema.TABLE_GEOMETRY_COLUMNS.items():
+        table = get_table(table_name, db=db)
+        if table.exists() is False:
+            continue
+
+        for column_name in column_names:
+            if column_name in table.columns_dict:
+                geometry_columns.append((table_name, column_name))
+
+    return geometry_columns
+
+
+def build_database(
+    db: Database,
+    use_spatialite: bool = False,
+    use_rtree: bool = False,
+    use_simplified_paths: bool = False,
+    partition_samples: bool = False,
+    compact_keys: bool = False,
+    date_columns: bool = False,
+):
     """
     Build the Arc Export SQLite database structure.
+
+    With ``use_rtree`` the places, timeline items and samples get R*Tree
+    indexes, which work without SpatiaLite. With ``use_simplified_paths`` the
+    timeline items get their simplified samples path columns, which they then
+    keep.
+
+    With ``partition_samples`` the samples are saved to a table per month
+    and ``samples`` is a view of them all. Once partitioned a database stays
+    partitioned.
+
+    With ``compact_keys`` the places, timeline items and samples are keyed by
+    integer ids from the uuids table rather than Arc's UUIDs. This can only be
+    chosen for a new database, which then keeps using them.
+
+    With ``date_columns`` the timeline items and samples get generated epoch
+    and local date columns, which they then keep.
+
+    The daily activity and place visit rollup tables are created and filled
+    in from any timeline items that are already saved.
+
+    New databases get the current schema version. An older database with
+    geometry columns has to be migrated with ``migrate_database`` before
+    adding more geometries to it, as they'd be in a different axis order.
     """
+    needs_migration = (
+        get_schema_version(db) < schema.SCHEMA_VERSION
+        and len(get_geometry_columns(db)) > 0
+    )
+    if needs_migration and use_spatialite:
+        raise errors.DatabaseMigrationRequiredError(
+            "The database's geometries are from an older version, run "
+            "arc-to-sqlite-migrate on it first."
+        )
+
     arc_export_files_table = get_table("arc_export_files", db=db)
     timeline_items_table = get_table("timeline_items", db=db)
     samples_table = get_table("samples", db=db)
     places_table = get_table("places", db=db)
 
+    if partition_samples and samples_table.exists():
+        raise errors.IncompatibleOptionsError(
+            "The samples in this database are already saved to a single "
+            "table, so they can't be partitioned."
+        )
+
+    partition_samples = partition_samples or is_samples_partitioned(db)
+    if compact_keys and places_table.exists() and not uses_compact_keys(db):
+        raise errors.IncompatibleOptionsError(
+            "The keys in this database are already UUIDs, so they can't be "
+            "compacted."
+        )
+
+    compact_keys = compact_keys or uses_compact_keys(db)
+    use_simplified_paths = use_simplified_paths or uses_simplified_paths(db)
+
+    if partition_samples and (use_spatialite or use_rtree):
+        raise errors.IncompatibleOptionsError(
+            "Partitioned samples can't be used with SpatiaLite or R*Tree "
+            "indexes."
+        )
+
     if arc_export_files_table.exists() is False:
         arc_export_files_table.create(
-            columns={
-                "id": int,
-                "file_name": str,
-                "file_path": str,
-                "file_size": int,
-                "file_checksum": str,
-                "export_type": str,
-                "last_processed_at": datetime.datetime,
-            },
+            columns=schema.ARC_EXPORT_FILES_COLUMNS,
             pk="id",
         )
         logger.info(f"Created the {arc_export_files_table.name} table.")
 
+    uuids_table = get_table("uuids", db=db)
+    if compact_keys and uuids_table.exists() is False:
+        uuids_table.create(columns=schema.UUIDS_COLUMNS, pk="id")
+        uuids_table.create_index(["uuid"], unique=True)
+        logger.info(f"Created the {uuids_table.name} table.")
+
+    # Added after the table was first released, so older databases need them.
+    for column in ("file_mtime_ns", "file_inode", "stats"):
+        if column not in arc_export_files_table.columns_dict:
+            arc_export_files_table.add_column(
+                column, schema.ARC_EXPORT_FILES_COLUMNS[column]
+            )
+
     if places_table.exists() is False:
-        columns = {
-            "place_id": str,
-            "name": str,
-            "street_address": str,
-            "latitude": float,
-            "longitude": float,
-            "radius_sd": float,
-            "radius_mean": float,
-            "mapbox_place_id": str,
-            "mapbox_category": str,
-            "google_place_id": str,
-            "google_primary_type": str,
-            "seconds_from_gmt": int,
-            "last_saved_at": datetime.datetime,
-            "arc_export_file_id": int,
-            "created_at": datetime.datetime,
-            "updated_at": datetime.datetime,
-        }
 
         places_table.create(
-            columns=columns,
+            columns=get_table_columns(
+                places_table.name,
+                schema.PLACES_COLUMNS,
+                compact_keys=compact_keys,
+            ),
             pk="place_id",
             foreign_keys=(("arc_export_file_id", "arc_export_files", "id"),),
         )
         places_table.enable_fts(
-            ["name", "street_address"], create_triggers=True
+            schema.TABLE_FTS_COLUMNS[places_table.name], create_triggers=True
         )
 
         if use_spatialite:
@@ -118,44 +918,20 @@ def build_database(db: Database, use_spatialite: bool = False):
 
         logger.info(f"Created the {places_table.name} table.")
 
-    create_table_indexes(places_table, ["latitude", "longitude"])
+    create_table_indexes(
+        arc_export_files_table,
+        schema.TABLE_INDEXES[arc_export_files_table.name],
+    )
+    create_table_indexes(places_table, schema.TABLE_INDEXES[places_table.name])
 
     if timeline_items_table.exists() is False:
-        columns = {
-            "item_id": str,
-            "next_item_id": str,
-            "previous_item_id": str,
-            "place_id": str,
-            "starts_at": datetime.datetime,
-            "ends_at": datetime.datetime,
-            "latitude": float,
-            "longitude": float,
-            "altitude": float,
-            "radius_sd": float,
-            "radius_mean": float,
-            "step_count": int,
-            "hk_step_count": int,
-            "floors_ascended": int,
-            "floors_descended": int,
-            "street_address": str,
-            "manual_place": bool,
-            "is_visit": bool,
-            "average_heart_rate": float,
-            "max_heart_rate": int,
-            "active_energy_burned": float,
-            "activity_type": str,
-            "activity_type_confidence_score": float,
-            "manual_activity_type": bool,
-            "uncertain_activity_type": bool,
-            "unknown_activity_type": bool,
-            "last_saved_at": datetime.datetime,
-            "arc_export_file_id": int,
-            "created_at": datetime.datetime,
-            "updated_at": datetime.datetime,
-        }
 
         timeline_items_table.create(
-            columns=columns,
+            columns=get_table_columns(
+                timeline_items_table.name,
+                schema.TIMELINE_ITEMS_COLUMNS,
+                compact_keys=compact_keys,
+            ),
             pk="item_id",
             foreign_keys=(
                 ("next_item_id", "timeline_items", "item_id"),
@@ -165,7 +941,8 @@ def build_database(db: Database, use_spatialite: bool = False):
             ),
         )
         timeline_items_table.enable_fts(
-            ["street_address"], create_triggers=True
+            schema.TABLE_FTS_COLUMNS[timeline_items_table.name],
+            create_triggers=True,
         )
 
         if use_spatialite:
@@ -178,60 +955,253 @@ def build_database(db: Database, use_spatialite: bool = False):
         logger.info(f"Created the {timeline_items_table.name} table.")
 
     create_table_indexes(
-        timeline_items_table,
-        [
-            "next_item_id",
-            "previous_item_id",
-            "place_id",
-            "latitude",
-            "longitude",
-            "starts_at",
-            "ends_at",
-        ],
+        timeline_items_table, schema.TABLE_INDEXES[timeline_items_table.name]
     )
 
-    if samples_table.exists() is False:
-        samples_table.create(
-            columns={
-                "sample_id": str,
-                "timeline_item_id": str,
-                "taken_at": datetime.datetime,
-                "latitude": float,
-                "longitude": float,
-                "altitude": float,
-                "recording_state": str,
-                "moving_state": str,
-                "xy_acceleration": float,
-                "z_acceleration": float,
-                "course": float,
-                "course_variance": int,
-                "speed": float,
-                "horizontal_accuracy": float,
-                "vertical_accuracy": float,
-                "step_hz": float,
-                "seconds_from_gmt": int,
-                "last_saved_at": datetime.datetime,
-                "arc_export_file_id": int,
-                "created_at": datetime.datetime,
-                "updated_at": datetime.datetime,
-            },
-            pk="sample_id",
-            foreign_keys=(
-                ("timeline_item_id", "timeline_items", "item_id"),
-                ("arc_export_file_id", "arc_export_files", "id"),
-            ),
+    for column in ("seconds_from_gmt", "distance"):
+        if column not in timeline_items_table.columns_dict:
+            timeline_items_table.add_column(
+                column, schema.TIMELINE_ITEMS_COLUMNS[column]
+            )
+
+    # After seconds_from_gmt, which older databases are missing.
+    create_date_expression_indexes(
+        timeline_items_table, timeline_items_table.name
+    )
+
+    if use_simplified_paths:
+        for column in schema.SIMPLIFIED_PATH_TOLERANCES:
+            if column not in timeline_items_table.columns_dict:
+                timeline_items_table.add_column(column, str)
+
+    if partition_samples:
+        samples_partitions_table = get_table(
+            "arc_export_file_samples_partitions", db=db
         )
+        if samples_partitions_table.exists() is False:
+            samples_partitions_table.create(
+                columns=schema.ARC_EXPORT_FILE_SAMPLES_PARTITIONS_COLUMNS,
+                pk=("arc_export_file_id", "table_name"),
+                foreign_keys=(
+                    ("arc_export_file_id", "arc_export_files", "id"),
+                ),
+            )
+            logger.info(f"Created the {samples_partitions_table.name} table.")
 
-        if use_spatialite:
-            samples_table.add_geometry_column("coordinates", "GEOMETRY")
-            samples_table.create_spatial_index("coordinates")
+        if is_samples_partitioned(db) is False:
+            refresh_samples_view(db)
 
-        logger.info(f"Created the {samples_table.name} table.")
+        for table_name in get_samples_partition_names(db):
+            create_table_indexes(
+                get_table(table_name, db=db), schema.TABLE_INDEXES["samples"]
+            )
+    else:
+        if samples_table.exists() is False:
+            create_samples_table(
+                samples_table,
+                use_spatialite=use_spatialite,
+                compact_keys=compact_keys,
+            )
 
-    create_table_indexes(
-        samples_table,
-        indexes=["timeline_item_id", "taken_at", "longitude", "latitude"],
-    )
+        create_table_indexes(
+            samples_table, schema.TABLE_INDEXES[samples_table.name]
+        )
+
+    if use_rtree:
+        for table_name in schema.RTREE_TABLES:
+            create_rtree_index(db, table_name)
+
+    restore_bulk_load_triggers(db)
+
+    create_daily_rollup_tables(db, compact_keys=compact_keys)
+
+    if date_columns or uses_date_columns(db):
+        add_date_columns(timeline_items_table, timeline_items_table.name)
+
+        samples_table_names = (
+            get_samples_partition_names(db)
+            if partition_samples
+            else [samples_table.name]
+        )
+        for table_name in samples_table_names:
+            add_date_columns(get_table(table_name, db=db), "samples")
+
+    # Without any geometries there is nothing to migrate.
+    if needs_migration is False:
+        set_schema_version(db, schema.SCHEMA_VERSION)
+
+
+def migrate_database(db: Database) -> t.List[int]:
+    """
+    Migrate a database built by an older version to the current schema
+    version, returning the versions it was migrated to.
+
+    The database must have been opened with SpatiaLite loaded.
+    """
+    migrations = {1: migrate_geometry_axis_order}
+
+    applied = []
+    for version in range(get_schema_version(db) + 1, schema.SCHEMA_VERSION + 1):
+        with transaction(db):
+            migrations[version](db)
+            set_schema_version(db, version)
+
+        logger.info(f"Migrated the database to version {version}.")
+        applied.append(version)
+
+    return applied
+
+
+def migrate_geometry_axis_order(db: Database):
+    """
+    Swap the x and y of every geometry, which used to be x=latitude,
+    y=longitude, and rebuild their spatial indexes.
+
+    Each spatial index is dropped before rewriting the geometries and created
+    again afterwards, so it's built in one pass rather than row by row.
+    """
+    for table_name, column_name in get_geometry_columns(db):
+        index_name = f"idx_{table_name}_{column_name}"
+        has_spatial_index = get_table(index_name, db=db).exists()
+
+        if has_spatial_index:
+            db.execute(
+                "SELECT DisableSpatialIndex(?, ?)", [table_name, column_name]
+            )
+            db.execute(f"DROP TABLE [{index_name}]")
+
+        db.execute(
+            f"UPDATE [{table_name}] "
+            f"SET [{column_name}] = SwapCoordinates([{column_name}]) "
+            f"WHERE [{column_name}] IS NOT NULL"
+        )
+
+        if has_spatial_index:
+            db.execute(
+                "SELECT CreateSpatialIndex(?, ?)", [table_name, column_name]
+            )
+
+        logger.info(f"Swapped the axis order of {table_name}.{column_name}.")
+
+
+def get_bulk_load_tables(db: Database) -> t.Dict[str, str]:
+    """
+    Get the tables whose indexes and triggers are dropped while bulk loading,
+    and the table in the schema each is built from. Samples partitions
+    created while bulk loading are created with their indexes.
+    """
+    bulk_tables = {"places": "places", "timeline_items": "timeline_items"}
+    if is_samples_partitioned(db):
+        for table_name in get_samples_partition_names(db):
+            bulk_tables[table_name] = "samples"
+    else:
+        bulk_tables["samples"] = "samples"
+
+    return bulk_tables
+
+
+def restore_bulk_load_triggers(db: Database):
+    """
+    Recreate the full-text search and R*Tree triggers missing from a bulk load
+    that was interrupted before it could finish, and repopulate the tables
+    they keep up to date. The indexes are recreated by ``build_database``.
+    """
+    trigger_names = {
+        row[0]
+        for row in db.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger'"
+        )
+    }
+
+    def has_triggers(name: str) -> bool:
+        return all(
+            f"{name}_{suffix}" in trigger_names for suffix in ("ai", "ad", "au")
+        )
+
+    for table_name in get_bulk_load_tables(db):
+        table = get_table(table_name, db=db)
+        if table.exists() is False:
+            continue
+
+        if (
+            table_name in schema.TABLE_FTS_COLUMNS
+            and get_table(f"{table_name}_fts", db=db).exists()
+            and not has_triggers(table_name)
+        ):
+            table.enable_fts(
+                schema.TABLE_FTS_COLUMNS[table_name],
+                create_triggers=True,
+                replace=True,
+            )
+            logger.info(f"Rebuilt the {table_name}_fts table.")
+
+        rtree_table_name = get_rtree_table_name(table_name)
+        if get_table(rtree_table_name, db=db).exists() and not has_triggers(
+            rtree_table_name
+        ):
+            with db.conn:
+                rebuild_rtree_index(db, table_name)
+                create_rtree_triggers(db, table_name)
+            logger.info(f"Rebuilt the {rtree_table_name} table.")
+
+
+@contextmanager
+def bulk_load(db: Database) -> t.Iterator[Database]:
+    """
+    Drop the secondary indexes and full-text search and R*Tree triggers on the
+    places, timeline items and samples tables while bulk loading data, then
+    rebuild the indexes and repopulate the full-text search and R*Tree tables
+    in one pass.
+
+    Meant for initial backfills, where maintaining them row by row costs more
+    than building them once at the end. If the process is killed before they
+    are rebuilt, ``build_database`` puts them back on the next run.
+    """
+    bulk_tables = get_bulk_load_tables(db)
+    rtree_tables = {
+        table_name: get_table(get_rtree_table_name(table_name), db=db).exists()
+        for table_name in bulk_tables
+    }
+
+    for table_name, schema_table_name in bulk_tables.items():
+        table = get_table(table_name, db=db)
+        indexed_columns = {
+            (column,) for column in get_table_indexes(db, schema_table_name)
+        }
+        for index in table.indexes:
+            if index.unique == 0 and tuple(index.columns) in indexed_columns:
+                db.execute(f"DROP INDEX [{index.name}]")
+
+        if table_name in schema.TABLE_FTS_COLUMNS:
+            for suffix in ("ai", "ad", "au"):
+                db.execute(f"DROP TRIGGER IF EXISTS [{table_name}_{suffix}]")
+
+        if rtree_tables[table_name]:
+            drop_rtree_triggers(db, table_name)
+
+    logger.info("Dropped the indexes and full-text search triggers.")
+
+    try:
+        yield db
+    finally:
+        for table_name, schema_table_name in bulk_tables.items():
+            table = get_table(table_name, db=db)
+            create_table_indexes(
+                table, get_table_indexes(db, schema_table_name)
+            )
+
+            if table_name in schema.TABLE_FTS_COLUMNS:
+                table.enable_fts(
+                    schema.TABLE_FTS_COLUMNS[table_name],
+                    create_triggers=True,
+                    replace=True,
+                )
+
+            if rtree_tables[table_name]:
+                rebuild_rtree_index(db, table_name)
+                create_rtree_triggers(db, table_name)
+
+        logger.info("Rebuilt the indexes and full-text search tables.")
 
 
 def get_arc_export_path(
@@ -247,62 +1217,293 @@ def get_arc_export_path(
             f"The Arc export path {path} does not exist."
         )
 
-    return path
+    return path
+
+
+def update_or_insert(
+    table: Table,
+    *,
+    conversions: t.Optional[t.Dict[str, str]] = None,
+    defaults: t.Optional[t.Dict[str, t.Any]] = None,
+    create_defaults: t.Optional[t.Dict[str, t.Any]] = None,
+    **kwargs,
+) -> Table:
+    """
+    Update or insert a row in a SQLite table.
+    """
+    defaults = defaults or {}
+    create_defaults = create_defaults or {}
+
+    existing_rows = table.pks_and_rows_where(
+        where=" AND ".join(f"{k} = :{k}" for k in kwargs),
+        where_args=kwargs,
+    )
+    row_pk, _ = next(existing_rows, (None, None))
+
+    # Check if there are multiple rows for the given query.
+    try:
+        next(existing_rows)
+        raise errors.UpdateOrInsertError(
+            "Failed to update or insert the row because multiple rows match query were found."
+        )
+    except StopIteration:
+        ...
+
+    if row_pk is not None:
+        return table.update(
+            pk_values=row_pk,
+            updates={**defaults, **kwargs},
+            conversions=conversions,
+        )
+
+    return table.insert(
+        record={**kwargs, **defaults, **create_defaults},
+        conversions=conversions,
+    )
+
+
+def bulk_update_or_insert(
+    table: Table,
+    rows: t.Iterable[t.Dict[str, t.Any]],
+    *,
+    pk: str,
+    conversions: t.Optional[t.Dict[str, str]] = None,
+    create_defaults: t.Optional[t.Dict[str, t.Any]] = None,
+    insert_only: t.Iterable[str] = (),
+) -> Table:
+    """
+    Update or insert many rows in a SQLite table by their primary key.
+
+    Like ``update_or_insert``, the ``create_defaults`` (and any ``insert_only``
+    columns in the rows) are only set on new rows and never overwrite existing
+    ones. The existing primary keys are looked up once per batch, then the new
+    rows are inserted together and the existing rows are updated with one
+    executemany per set of columns.
+    """
+    conversions = conversions or {}
+    create_defaults = create_defaults or {}
+    skip_on_update = {pk, *insert_only}
+
+    for batch in chunked(rows, BULK_BATCH_SIZE):
+        # If a row appears more than once the last one wins.
+        rows_by_pk = {row[pk]: row for row in batch}
+
+        placeholders = ", ".join("?" for _ in rows_by_pk)
+        existing_pks = {
+            existing_pk
+            for existing_pk, in table.db.execute(
+                f"SELECT [{pk}] FROM [{table.name}] "
+                f"WHERE [{pk}] IN ({placeholders})",
+                list(rows_by_pk),
+            )
+        }
+
+        new_rows = [
+            {**row, **create_defaults}
+            for row_pk, row in rows_by_pk.items()
+            if row_pk not in existing_pks
+        ]
+        if new_rows:
+            table.insert_all(new_rows, conversions=conversions)
+
+        # Group the updates by their columns, so each group is one statement.
+        updates: t.Dict[t.Tuple[str, ...], t.List[t.List[t.Any]]] = {}
+        for row_pk in existing_pks:
+            row = rows_by_pk[row_pk]
+            columns = tuple(key for key in row if key not in skip_on_update)
+            updates.setdefault(columns, []).append(
+                [jsonify_if_needed(row[key]) for key in columns] + [row_pk]
+            )
+
+        for columns, args in updates.items():
+            if not columns:
+                continue
+
+            sets = ", ".join(
+                f"[{column}] = {conversions.get(column, '?')}"
+                for column in columns
+            )
+            with table.db.conn:
+                table.db.conn.executemany(
+                    f"UPDATE [{table.name}] SET {sets} WHERE [{pk}] = ?",
+                    args,
+                )
+
+    return table
+
+
+def build_upsert_sql(
+    table_name: str,
+    columns: t.Sequence[str],
+    *,
+    pk: str,
+    conversions: t.Dict[str, str],
+    insert_only: t.Collection[str],
+) -> str:
+    """
+    Build an ``INSERT ... ON CONFLICT DO UPDATE`` statement for the columns,
+    which leaves the primary key and ``insert_only`` columns alone on update.
+    """
+    updates = [
+        f"[{column}] = excluded.[{column}]"
+        for column in columns
+        if column != pk and column not in insert_only
+    ]
+    on_conflict = (
+        f"DO UPDATE SET {', '.join(updates)}" if updates else "DO NOTHING"
+    )
+
+    column_names = ", ".join(f"[{column}]" for column in columns)
+    values = ", ".join(conversions.get(column, "?") for column in columns)
+    return (
+        f"INSERT INTO [{table_name}] ({column_names}) "
+        f"VALUES ({values}) ON CONFLICT([{pk}]) {on_conflict}"
+    )
+
+
+def bulk_upsert(
+    table: Table,
+    rows: t.Iterable[t.Dict[str, t.Any]],
+    *,
+    pk: str,
+    conversions: t.Optional[t.Dict[str, str]] = None,
+    insert_only: t.Iterable[str] = (),
+) -> Table:
+    """
+    Insert many rows in a SQLite table, updating the rows that already exist,
+    using SQLite's ``INSERT ... ON CONFLICT DO UPDATE``.
+
+    The ``insert_only`` columns (e.g. created_at) are set when a row is
+    created and never overwritten. Rows are written with one executemany per
+    batch and set of columns, so a missing key leaves the existing value
+    alone rather than setting it to NULL.
+
+    Falls back to ``bulk_update_or_insert`` on SQLite versions before 3.24,
+    which don't support upserts.
+    """
+    conversions = conversions or {}
+    insert_only = set(insert_only)
+
+    if table.db.sqlite_version < (3, 24, 0):
+        return bulk_update_or_insert(
+            table,
+            rows,
+            pk=pk,
+            conversions=conversions,
+            insert_only=insert_only,
+        )
+
+    for batch in chunked(rows, BULK_BATCH_SIZE):
+        # If a row appears more than once the last one wins.
+        rows_by_pk = {row[pk]: row for row in batch}
 
+        # Group the rows by their columns, so each group is one statement.
+        groups: t.Dict[t.Tuple[str, ...], t.List[t.List[t.Any]]] = {}
+        for row in rows_by_pk.values():
+            columns = tuple(sorted(row))
+            groups.setdefault(columns, []).append(
+                [jsonify_if_needed(row[column]) for column in columns]
+            )
 
-def update_or_insert(
+        for columns, args in groups.items():
+            sql = build_upsert_sql(
+                table.name,
+                columns,
+                pk=pk,
+                conversions=conversions,
+                insert_only=insert_only,
+            )
+            with table.db.conn:
+                table.db.conn.executemany(sql, args)
+
+    return table
+
+
+def bulk_upsert_tuples(
     table: Table,
+    columns: t.Sequence[str],
+    rows: t.Iterable[t.Sequence[t.Any]],
     *,
+    pk: str,
     conversions: t.Optional[t.Dict[str, str]] = None,
-    defaults: t.Optional[t.Dict[str, t.Any]] = None,
-    create_defaults: t.Optional[t.Dict[str, t.Any]] = None,
-    **kwargs,
+    insert_only: t.Iterable[str] = (),
 ) -> Table:
     """
-    Update or insert a row in a SQLite table.
-    """
-    defaults = defaults or {}
-    create_defaults = create_defaults or {}
-
-    existing_rows = table.pks_and_rows_where(
-        where=" AND ".join(f"{k} = :{k}" for k in kwargs),
-        where_args=kwargs,
-    )
-    row_pk, _ = next(existing_rows, (None, None))
-
-    # Check if there are multiple rows for the given query.
-    try:
-        next(existing_rows)
-        raise errors.UpdateOrInsertError(
-            "Failed to update or insert the row because multiple rows match query were found."
-        )
-    except StopIteration:
-        ...
+    Like ``bulk_upsert``, for rows that are tuples of values in the order of
+    ``columns``, which are passed straight to executemany. Unlike
+    ``bulk_upsert`` a missing value is a NULL, so it is written.
 
-    if row_pk is not None:
-        return table.update(
-            pk_values=row_pk,
-            updates={**defaults, **kwargs},
+    The values must already be types SQLite supports.
+    """
+    conversions = conversions or {}
+    insert_only = set(insert_only)
+
+    if table.db.sqlite_version < (3, 24, 0):
+        return bulk_upsert(
+            table,
+            (dict(zip(columns, row)) for row in rows),
+            pk=pk,
             conversions=conversions,
+            insert_only=insert_only,
         )
 
-    return table.insert(
-        record={**kwargs, **defaults, **create_defaults},
+    sql = build_upsert_sql(
+        table.name,
+        columns,
+        pk=pk,
         conversions=conversions,
+        insert_only=insert_only,
     )
+    for batch in chunked(rows, BULK_BATCH_SIZE):
+        with table.db.conn:
+            table.db.conn.executemany(sql, batch)
 
+    return table
 
-def calculate_file_obj_checksum(file_obj: t.BinaryIO) -> str:
+
+def calculate_file_obj_checksum(
+    file_obj: t.BinaryIO, chunk_size: int = 1024 * 1024
+) -> str:
     """
     Calculate the checksum of a file.
     """
     file_hash = hashlib.sha256()
-    while chunk := file_obj.read(8192):
+    while chunk := file_obj.read(chunk_size):
         file_hash.update(chunk)
 
     return file_hash.hexdigest()
 
 
+def calculate_file_checksum(file_path: Path) -> str:
+    """
+    Calculate the checksum of a file on disk, memory mapping it when possible
+    so it is hashed without being copied through read buffers.
+    """
+    with file_path.open("rb") as file_obj:
+        try:
+            with mmap.mmap(
+                file_obj.fileno(), 0, access=mmap.ACCESS_READ
+            ) as mapped_file:
+                return hashlib.sha256(mapped_file).hexdigest()
+        except (ValueError, OSError):
+            # Empty files can't be mapped, nor can files on some file systems.
+            return calculate_file_obj_checksum(file_obj)
+
+
+def is_arc_export_file_unchanged(
+    file_stat: os.stat_result, arc_export_file_data: t.Dict[str, t.Any]
+) -> bool:
+    """
+    Check if an Arc export file looks unchanged since it was last processed,
+    going by its size, modification time and inode.
+    """
+    return (
+        arc_export_file_data.get("file_size") == file_stat.st_size
+        and arc_export_file_data.get("file_mtime_ns") == file_stat.st_mtime_ns
+        and arc_export_file_data.get("file_inode") == file_stat.st_ino
+    )
+
+
 def get_arc_export_file_row(
     file_name: str, table: Table
 ) -> t.Union[t.Tuple[int, t.Dict[str, t.Any]], None]:
@@ -327,6 +1528,7 @@ def save_arc_export_file(
     file_checksum: str,
     row_id: t.Union[int, None],
     table: Table,
+    file_stat: t.Optional[os.stat_result] = None,
 ) -> Table:
     """
     Save the Arc export file metadata to the SQLite database.
@@ -334,6 +1536,7 @@ def save_arc_export_file(
     data = transform_arc_export_file_path(
         path=path,
         file_checksum=file_checksum,
+        file_stat=file_stat,
     )
 
     # Insert or update the file metadata.
@@ -349,28 +1552,25 @@ def save_places(
     use_spatialite: bool = False,
 ):
     """
-    Save the places data to the SQLite database.
+    Save the transformed places data to the SQLite database.
     """
     conversions = {}
     if use_spatialite:
-        conversions["coordinates"] = "GeomFromText(?, 4326)"
+        conversions["coordinates"] = "GeomFromWKB(?, 4326)"
 
+    now = datetime.datetime.utcnow()
     for place in places:
-        transform_place(place, use_spatialite=use_spatialite)
-        place_id = place.pop("place_id")
+        place["arc_export_file_id"] = arc_export_file_id
+        place["created_at"] = now
+        place["updated_at"] = now
 
-        place["updated_at"] = datetime.datetime.utcnow()
-
-        update_or_insert(
-            table=places_table,
-            conversions=conversions,
-            defaults=place,
-            create_defaults={
-                "arc_export_file_id": arc_export_file_id,
-                "created_at": datetime.datetime.utcnow(),
-            },
-            place_id=place_id,
-        )
+    bulk_upsert(
+        places_table,
+        places,
+        pk="place_id",
+        conversions=conversions,
+        insert_only=("arc_export_file_id", "created_at"),
+    )
 
 
 def save_timeline_items(
@@ -380,40 +1580,85 @@ def save_timeline_items(
     use_spatialite: bool = False,
 ):
     """
-    Save the timeline items data to the SQLite database.
+    Save the transformed timeline items data to the SQLite database.
     """
     conversions = {}
     if use_spatialite:
-        conversions["coordinates"] = "GeomFromText(?, 4326)"
-        conversions["samples_path"] = "GeomFromText(?, 4326)"
+        conversions["coordinates"] = "GeomFromWKB(?, 4326)"
+        conversions["samples_path"] = "GeomFromWKB(?, 4326)"
 
     for item in timeline_items:
-        transform_timeline_item(item, use_spatialite=use_spatialite)
         item["arc_export_file_id"] = arc_export_file_id
 
-    timeline_items_table.upsert_all(
-        timeline_items, pk="item_id", conversions=conversions
+    bulk_upsert(
+        timeline_items_table,
+        timeline_items,
+        pk="item_id",
+        conversions=conversions,
     )
 
 
 def save_samples(
-    samples: t.List[t.Dict[str, t.Any]],
+    samples: t.List[t.Tuple[t.Any, ...]],
     arc_export_file_id: int,
     samples_table: Table,
     use_spatialite: bool = False,
 ):
     """
-    Save the samples data to the SQLite database.
+    Save the samples data, transformed to tuples by
+    ``transform_sample_to_tuple``, to the SQLite database.
     """
-    for sample in samples:
-        transform_sample(sample, use_spatialite=use_spatialite)
-        sample["arc_export_file_id"] = arc_export_file_id
-
     conversions = {}
     if use_spatialite:
-        conversions["coordinates"] = "GeomFromText(?, 4326)"
+        conversions["coordinates"] = "GeomFromWKB(?, 4326)"
+
+    bulk_upsert_tuples(
+        samples_table,
+        get_sample_tuple_columns(use_spatialite) + ("arc_export_file_id",),
+        (sample + (arc_export_file_id,) for sample in samples),
+        pk="sample_id",
+        conversions=conversions,
+    )
+
+
+def save_partitioned_samples(
+    samples: t.List[t.Tuple[t.Any, ...]],
+    arc_export_file_id: int,
+    db: Database,
+):
+    """
+    Save the samples data, transformed to tuples by
+    ``transform_sample_to_tuple``, to the partition for the month each sample
+    was taken, and record which partitions the Arc export file saved to.
+    """
+    taken_at_index = get_sample_tuple_columns().index("taken_at")
+
+    partitions: t.Dict[str, t.List[t.Tuple[t.Any, ...]]] = {}
+    for sample in samples:
+        table_name = get_samples_partition_name(sample[taken_at_index])
+        partitions.setdefault(table_name, []).append(sample)
+
+    if not partitions:
+        return
+
+    existing_partition_names = set(get_samples_partition_names(db))
+    for table_name, partition_samples in partitions.items():
+        if table_name not in existing_partition_names:
+            create_samples_partition(db, table_name)
+
+        save_samples(
+            partition_samples,
+            arc_export_file_id=arc_export_file_id,
+            samples_table=get_table(table_name, db=db),
+        )
 
-    samples_table.upsert_all(samples, pk="sample_id", conversions=conversions)
+    get_table("arc_export_file_samples_partitions", db=db).insert_all(
+        (
+            {"arc_export_file_id": arc_export_file_id, "table_name": name}
+            for name in partitions
+        ),
+        ignore=True,
+    )
 
 
 def list_arc_export_files(
@@ -427,100 +1672,998 @@ def list_arc_export_files(
             yield file_path
 
 
-def extract_places_and_samples_from_timeline_items(
+class JSONStreamReader:
+    """
+    Decode JSON values one at a time from a text stream.
+
+    Only as much of the stream as is needed for the next value is held in
+    memory, which lets us walk the timelineItems array of a large export
+    without loading the whole document.
+    """
+
+    whitespace_re = re.compile(r"\s*")
+
+    def __init__(self, file_obj: t.TextIO, chunk_size: int = 64 * 1024):
+        self.file_obj = file_obj
+        self.chunk_size = chunk_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ""
+        self.position = 0
+
+    def read(self, size: int) -> bool:
+        """
+        Read more of the stream into the buffer, dropping anything already
+        consumed. Returns False at the end of the stream.
+        """
+        chunk = self.file_obj.read(size)
+        if not chunk:
+            return False
+
+        self.buffer = self.buffer[self.position :] + chunk
+        self.position = 0
+        return True
+
+    def peek(self) -> str:
+        """
+        Return the next non-whitespace character without consuming it, or an
+        empty string at the end of the stream.
+        """
+        while True:
+            match = self.whitespace_re.match(self.buffer, self.position)
+            self.position = match.end() if match else self.position
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if self.read(self.chunk_size) is False:
+                return ""
+
+    def expect(self, character: str):
+        """
+        Consume the given structural character (e.g. ``{`` or ``,``).
+        """
+        if self.peek() != character:
+            raise json.JSONDecodeError(
+                f"Expecting {character!r}", self.buffer, self.position
+            )
+
+        self.position += 1
+
+    def decode(self) -> t.Any:
+        """
+        Decode and consume the next JSON value.
+        """
+        self.peek()
+
+        # Double the read size each time the value turns out to be
+        # incomplete, so a large value isn't re-parsed once per chunk.
+        read_size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                if self.read(read_size) is False:
+                    raise
+            else:
+                # A number at the very end of the buffer may be truncated.
+                if end < len(self.buffer) or self.read(read_size) is False:
+                    self.position = end
+                    return value
+
+            read_size *= 2
+
+
+def iter_arc_export_timeline_items(
+    file_obj: t.TextIO, chunk_size: int = 64 * 1024
+) -> t.Generator[t.Dict[str, t.Any], None, None]:
+    """
+    Iterate over the timeline items in an Arc export, one at a time.
+    """
+    reader = JSONStreamReader(file_obj, chunk_size=chunk_size)
+
+    reader.expect("{")
+    while reader.peek() != "}":
+        key = reader.decode()
+        reader.expect(":")
+
+        if key == "timelineItems":
+            reader.expect("[")
+            while reader.peek() != "]":
+                yield reader.decode()
+
+                if reader.peek() == ",":
+                    reader.expect(",")
+            reader.expect("]")
+        else:
+            reader.decode()
+
+        if reader.peek() == ",":
+            reader.expect(",")
+    reader.expect("}")
+
+
+class IngestStats:
+    """
+    The wall and CPU time spent in each stage of ingesting Arc export files,
+    and the number of rows each stage handled.
+
+    The CPU time is the current thread's, so stages run in the planning
+    thread pool or in worker processes are measured on their own.
+    """
+
+    def __init__(
+        self, stages: t.Optional[t.Dict[str, t.Dict[str, float]]] = None
+    ):
+        self.stages: t.Dict[str, t.Dict[str, float]] = stages or {}
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, IngestStats) and self.stages == other.stages
+
+    def __repr__(self) -> str:
+        return f"IngestStats({self.stages!r})"
+
+    def add(
+        self, stage: str, wall: float = 0.0, cpu: float = 0.0, rows: float = 0
+    ):
+        totals = self.stages.setdefault(
+            stage, {"wall": 0.0, "cpu": 0.0, "rows": 0}
+        )
+        totals["wall"] += wall
+        totals["cpu"] += cpu
+        totals["rows"] += rows
+
+    @contextmanager
+    def measure(self, stage: str, rows: float = 0) -> t.Iterator[None]:
+        """
+        Add the time spent in the block to the stage.
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.add(
+                stage,
+                wall=time.perf_counter() - wall,
+                cpu=time.thread_time() - cpu,
+                rows=rows,
+            )
+
+    def update(self, other: "IngestStats"):
+        for stage, totals in other.stages.items():
+            self.add(stage, **totals)
+
+    def as_dict(self) -> t.Dict[str, t.Dict[str, float]]:
+        return {stage: dict(totals) for stage, totals in self.stages.items()}
+
+    def as_table(self) -> str:
+        """
+        Format the stages as a table of their times, rows and throughput.
+        """
+        lines = [
+            f"{'stage':<20} {'wall':>9} {'cpu':>9} {'rows':>10} {'rows/s':>10}"
+        ]
+        for stage, totals in self.stages.items():
+            line = f"{stage:<20} {totals['wall']:>8.3f}s {totals['cpu']:>8.3f}s"
+            # Not every stage handles rows, like the checksums.
+            if totals["rows"]:
+                line += f" {int(totals['rows']):>10}"
+                if totals["wall"]:
+                    line += f" {totals['rows'] / totals['wall']:>10.0f}"
+            lines.append(line)
+        return "\n".join(lines)
+
+
+class ArcExportBatch(t.NamedTuple):
+    """
+    The transformed places, timeline items and samples from a batch of
+    timeline items in an Arc export file.
+
+    There are a lot more samples than anything else, so they are tuples in the
+    order of ``get_sample_tuple_columns`` rather than dictionaries.
+    """
+
+    places: t.List[t.Dict[str, t.Any]]
+    timeline_items: t.List[t.Dict[str, t.Any]]
+    samples: t.List[t.Tuple[t.Any, ...]]
+
+
+class ArcExportFilePlan(t.NamedTuple):
+    """
+    What needs doing with an Arc export file, decided before any of the files
+    are processed.
+
+    The status is "new", "changed" or "unchanged". The checksum is None when
+    an unchanged file was skipped by its stat signature without hashing. The
+    stats have how long the checksum took.
+    """
+
+    file_path: Path
+    file_stat: os.stat_result
+    file_checksum: t.Optional[str]
+    arc_export_file_id: t.Optional[int]
+    status: t.Literal["new", "changed", "unchanged"]
+    stats: IngestStats
+
+
+class PreparedArcExportFile(t.NamedTuple):
+    """
+    An Arc export file that is ready to be saved to the SQLite database.
+
+    The batches are either a list (when prepared in a worker process) or a
+    generator that decodes the file as it is saved. The stats are filled in
+    as the file is decoded, transformed and saved.
+    """
+
+    plan: ArcExportFilePlan
+    batches: t.Iterable[ArcExportBatch]
+    stats: IngestStats
+
+
+def transform_arc_export_batch(
     timeline_items: t.List[t.Dict[str, t.Any]],
-) -> t.Tuple[
-    t.List[t.Dict[str, t.Any]],
-    t.List[t.Dict[str, t.Any]],
-    t.List[t.Dict[str, t.Any]],
-]:
+    use_spatialite: bool = False,
+    use_simplified_paths: bool = False,
+    use_distances: bool = False,
+) -> ArcExportBatch:
     """
-    Extract places and samples from the timeline items.
+    Extract the places and samples from the Arc JSON timeline items and
+    transform everything to the SQLite schema.
+
+    Each timeline item's samples are transformed once and their coordinates
+    shared with the timeline item for its samples_path, rather than copied.
+    With ``use_distances`` each timeline item gets the distance along its
+    samples, for the daily rollups.
     """
-    places = []
-    samples = []
+    batch = ArcExportBatch(places=[], timeline_items=[], samples=[])
+    samples_paths: t.List[t.List[t.Tuple[t.Any, t.Any]]] = []
+
+    sample_columns = get_sample_tuple_columns()
+    latitude_index = sample_columns.index("latitude")
+    longitude_index = sample_columns.index("longitude")
+    seconds_from_gmt_index = sample_columns.index("seconds_from_gmt")
 
     for item in timeline_items:
-        # Extract places from the timeline item.
-        try:
-            places.append(item.pop("place"))
-        except KeyError:
-            ...
+        row = transform_timeline_item(item)
+
+        place = item.pop("place", None)
+        if place is not None:
+            batch.places.append(transform_place(place))
+
+        samples = [
+            transform_sample_to_tuple(sample)
+            for sample in item.pop("samples", None) or []
+        ]
+        batch.samples.extend(samples)
+
+        # Timeline items don't have their own time zone offset, so they take
+        # it from their place or else their first sample with one.
+        if row.get("seconds_from_gmt") is None:
+            place_row = batch.places[-1] if place is not None else {}
+            if place_row.get("seconds_from_gmt") is not None:
+                row["seconds_from_gmt"] = place_row["seconds_from_gmt"]
+            else:
+                row["seconds_from_gmt"] = next(
+                    (
+                        sample[seconds_from_gmt_index]
+                        for sample in samples
+                        if sample[seconds_from_gmt_index] is not None
+                    ),
+                    None,
+                )
+
+        # Set to None without samples, so saving a timeline item again clears
+        # the distance it had before.
+        if use_distances:
+            row["distance"] = (
+                calculate_path_distance(
+                    (sample[latitude_index], sample[longitude_index])
+                    for sample in samples
+                )
+                if samples
+                else None
+            )
+
+        batch.timeline_items.append(row)
 
-        # Extract samples from the timeline item.
-        samples.extend(deepcopy(item["samples"]))
+        if use_spatialite or use_simplified_paths:
+            samples_paths.append(
+                [
+                    (sample[latitude_index], sample[longitude_index])
+                    for sample in samples
+                ]
+            )
+
+    if use_simplified_paths:
+        add_arc_export_batch_simplified_paths(batch, samples_paths)
 
-    return timeline_items, places, samples
+    if use_spatialite:
+        return add_arc_export_batch_geometries(batch, samples_paths)
 
+    return batch
 
-def process_arc_export_file(
-    db: Database, file_path: Path, use_spatialite: bool = False
+
+def add_arc_export_batch_geometries(
+    batch: ArcExportBatch,
+    samples_paths: t.List[t.List[t.Tuple[t.Any, t.Any]]],
+) -> ArcExportBatch:
+    """
+    Add the SpatiaLite geometries, as WKB, to a batch transformed without
+    them. ``samples_paths`` are the coordinates of each timeline item's
+    samples, in the same order as the timeline items.
+
+    The geometries for the whole batch are built with a few of shapely's
+    vectorized functions, rather than a Point at a time.
+    """
+    # Missing geometries are set to None, so saving a row again clears any it
+    # had before.
+    for rows in (batch.places, batch.timeline_items):
+        points = convert_coordinates_to_wkb_points(
+            (row.get("latitude"), row.get("longitude")) for row in rows
+        )
+        for row, point in zip(rows, points):
+            row["coordinates"] = point
+
+    samples_path_lines = convert_coordinates_to_wkb_line_strings(samples_paths)
+    for row, line in zip(batch.timeline_items, samples_path_lines):
+        row["samples_path"] = line
+
+    sample_points = convert_coordinates_to_wkb_points(
+        itertools.chain.from_iterable(samples_paths)
+    )
+    return batch._replace(
+        samples=[
+            sample + (point,)
+            for sample, point in zip(batch.samples, sample_points)
+        ]
+    )
+
+
+def add_arc_export_batch_simplified_paths(
+    batch: ArcExportBatch,
+    samples_paths: t.List[t.List[t.Tuple[t.Any, t.Any]]],
 ):
     """
-    Process an Arc export file and save the data to the SQLite database.
+    Add each timeline item's samples path, simplified at each of the
+    tolerances in ``schema.SIMPLIFIED_PATH_TOLERANCES`` and encoded as a
+    polyline, so maps can show a lightweight path when zoomed out.
     """
-    arc_export_files_table = get_table("arc_export_files", db=db)
+    line_strings = convert_coordinates_to_line_strings(samples_paths)
+
+    for column, tolerance in schema.SIMPLIFIED_PATH_TOLERANCES.items():
+        polylines = convert_line_strings_to_simplified_polylines(
+            line_strings, tolerance
+        )
+        for row, polyline in zip(batch.timeline_items, polylines):
+            row[column] = polyline
 
-    # Calculate the checksum of the file and save the file metadata to the
-    # database.
-    with file_path.open("rb") as file_obj:
-        file_checksum = calculate_file_obj_checksum(file_obj)
 
-    # Check if the file has already been processed.
-    arc_export_file_values = get_arc_export_file_row(
-        file_path.name, arc_export_files_table
+def compact_arc_export_batch_keys(
+    db: Database, batch: ArcExportBatch
+) -> ArcExportBatch:
+    """
+    Replace the UUIDs in a transformed batch with their integer ids from the
+    uuids table, looked up (and added) for the whole batch at once.
+    """
+    place_columns = schema.TABLE_UUID_COLUMNS["places"]
+    timeline_item_columns = schema.TABLE_UUID_COLUMNS["timeline_items"]
+
+    sample_columns = get_sample_tuple_columns()
+    sample_indexes = [
+        sample_columns.index(column)
+        for column in schema.TABLE_UUID_COLUMNS["samples"]
+    ]
+
+    uuid_ids = get_uuid_ids(
+        db,
+        itertools.chain(
+            (
+                row.get(column)
+                for row in batch.places
+                for column in place_columns
+            ),
+            (
+                row.get(column)
+                for row in batch.timeline_items
+                for column in timeline_item_columns
+            ),
+            (
+                sample[index]
+                for sample in batch.samples
+                for index in sample_indexes
+            ),
+        ),
     )
-    if arc_export_file_values is not None:
-        arc_export_file_row_id, arc_export_file_data = arc_export_file_values
 
-        # If the file checksum is the same, we don't need to process it again.
-        if arc_export_file_data["file_checksum"] == file_checksum:
-            logger.info(
-                f"Skipping file {file_path.name} because it has already been processed."
-            )
-            return
-    else:
-        arc_export_file_row_id = None
+    for rows, columns in (
+        (batch.places, place_columns),
+        (batch.timeline_items, timeline_item_columns),
+    ):
+        for row in rows:
+            for column in columns:
+                if row.get(column) is not None:
+                    row[column] = uuid_ids[row[column]]
 
-    arc_export_files_table = save_arc_export_file(
-        file_path,
-        file_checksum=file_checksum,
-        row_id=arc_export_file_row_id,
-        table=arc_export_files_table,
+    samples = []
+    for sample in batch.samples:
+        values = list(sample)
+        for index in sample_indexes:
+            if values[index] is not None:
+                values[index] = uuid_ids[values[index]]
+        samples.append(tuple(values))
+
+    return batch._replace(samples=samples)
+
+
+def get_arc_export_file_last_saved_at(
+    db: Database, arc_export_file_id: int
+) -> t.Dict[str, t.Dict[t.Any, t.Optional[str]]]:
+    """
+    Get when the places, timeline items and samples saved from an Arc export
+    file were last saved in Arc, keyed by table name and then primary key,
+    with one query per table.
+    """
+    return {
+        table_name: dict(
+            db.execute(
+                f"SELECT [{pk}], last_saved_at FROM [{table_name}] "
+                f"WHERE arc_export_file_id = ?",
+                [arc_export_file_id],
+            ).fetchall()
+        )
+        for table_name, pk in (
+            ("places", "place_id"),
+            ("timeline_items", "item_id"),
+            ("samples", "sample_id"),
+        )
+    }
+
+
+def count_arc_export_batch_rows(batch: ArcExportBatch) -> int:
+    return len(batch.places) + len(batch.timeline_items) + len(batch.samples)
+
+
+def remove_unchanged_arc_export_batch_rows(
+    batch: ArcExportBatch,
+    last_saved_at: t.Dict[str, t.Dict[t.Any, t.Optional[str]]],
+) -> ArcExportBatch:
+    """
+    Remove the places, timeline items and samples from a transformed batch
+    whose last_saved_at is the same as the one already saved, as returned by
+    ``get_arc_export_file_last_saved_at``.
+
+    A timeline item with changed samples is kept even if it's unchanged
+    itself, as its path and distance come from its samples. Rows that appear
+    more than once are compared as the last of them, which is the one the
+    upsert would have saved.
+    """
+
+    def is_changed(table_name: str, pk: t.Any, value: t.Optional[str]):
+        return value is None or last_saved_at[table_name].get(pk) != value
+
+    sample_columns = get_sample_tuple_columns()
+    sample_id_index = sample_columns.index("sample_id")
+    timeline_item_id_index = sample_columns.index("timeline_item_id")
+    last_saved_at_index = sample_columns.index("last_saved_at")
+
+    places = {row["place_id"]: row for row in batch.places}
+    timeline_items = {row["item_id"]: row for row in batch.timeline_items}
+    samples = {sample[sample_id_index]: sample for sample in batch.samples}
+
+    changed_samples = [
+        sample
+        for sample_id, sample in samples.items()
+        if is_changed("samples", sample_id, sample[last_saved_at_index])
+    ]
+    changed_item_ids = {
+        sample[timeline_item_id_index] for sample in changed_samples
+    }
+
+    return ArcExportBatch(
+        places=[
+            row
+            for place_id, row in places.items()
+            if is_changed("places", place_id, row.get("last_saved_at"))
+        ],
+        timeline_items=[
+            row
+            for item_id, row in timeline_items.items()
+            if item_id in changed_item_ids
+            or is_changed("timeline_items", item_id, row.get("last_saved_at"))
+        ],
+        samples=changed_samples,
+    )
+
+
+def delete_stale_arc_export_file_rows(
+    db: Database,
+    timeline_item_ids: t.Iterable[t.Any],
+    sample_ids: t.Iterable[t.Any],
+    partition_samples: bool = False,
+) -> int:
+    """
+    Delete the timeline items and samples that are no longer in their Arc
+    export file, returning how many rows were deleted.
+
+    The places are kept, as they are shared by the timeline items of other
+    export files.
+    """
+    samples_table_names = (
+        get_samples_partition_names(db) if partition_samples else ["samples"]
     )
-    arc_export_file_row_id = arc_export_files_table.last_pk
-    if arc_export_file_row_id is None:
-        raise errors.ArcExportFilesRowFailedError(
-            "The arc_export_files row failed to save to the database."
+
+    deleted = 0
+    for table_names, pk, ids in (
+        (["timeline_items"], "item_id", timeline_item_ids),
+        (samples_table_names, "sample_id", sample_ids),
+    ):
+        for ids_chunk in chunked(ids, BULK_BATCH_SIZE):
+            placeholders = ", ".join("?" for _ in ids_chunk)
+            for table_name in table_names:
+                deleted += db.execute(
+                    f"DELETE FROM [{table_name}] WHERE [{pk}] IN "
+                    f"({placeholders})",
+                    ids_chunk,
+                ).rowcount
+
+    return deleted
+
+
+def iter_arc_export_file_batches(
+    file_path: Path,
+    batch_size: int = TIMELINE_ITEMS_BATCH_SIZE,
+    use_spatialite: bool = False,
+    use_simplified_paths: bool = False,
+    use_distances: bool = False,
+    stats: t.Optional[IngestStats] = None,
+) -> t.Generator[ArcExportBatch, None, None]:
+    """
+    Decompress, parse and transform an Arc export file, a batch of timeline
+    items at a time.
+    """
+    if stats is None:
+        stats = IngestStats()
+
+    with gzip.open(file_path, "rt", encoding="utf-8") as file_obj:
+        timeline_items_chunks = chunked(
+            iter_arc_export_timeline_items(file_obj), batch_size
+        )
+
+        while True:
+            with stats.measure("decode"):
+                timeline_items = next(timeline_items_chunks, None)
+            if timeline_items is None:
+                break
+            stats.add("decode", rows=len(timeline_items))
+
+            with stats.measure("transform", rows=len(timeline_items)):
+                batch = transform_arc_export_batch(
+                    timeline_items,
+                    use_spatialite=use_spatialite,
+                    use_simplified_paths=use_simplified_paths,
+                    use_distances=use_distances,
+                )
+            yield batch
+
+
+def load_arc_export_files_index(
+    db: Database,
+) -> t.Dict[str, t.Tuple[int, t.Dict[str, t.Any]]]:
+    """
+    Load the whole arc_export_files table into a dictionary keyed by file name,
+    so skip decisions don't need a query per file.
+    """
+    return {
+        row["file_name"]: (pk, row)
+        for pk, row in get_table("arc_export_files", db=db).pks_and_rows_where()
+    }
+
+
+def plan_arc_export_file(
+    file_path: Path,
+    arc_export_file_row: t.Optional[t.Tuple[int, t.Dict[str, t.Any]]] = None,
+    quick_check: bool = False,
+) -> ArcExportFilePlan:
+    """
+    Decide whether an Arc export file is new, changed or unchanged since it
+    was last processed, by checksumming it.
+
+    With ``quick_check`` a file whose size, modification time and inode match
+    its arc_export_files row is considered unchanged without being hashed.
+    """
+    # The file is stat'ed before it is hashed, so if it changes while being
+    # hashed the stored signature won't match it on the next run.
+    file_stat = file_path.stat()
+    stats = IngestStats()
+
+    if arc_export_file_row is None:
+        with stats.measure("checksum"):
+            file_checksum = calculate_file_checksum(file_path)
+        return ArcExportFilePlan(
+            file_path=file_path,
+            file_stat=file_stat,
+            file_checksum=file_checksum,
+            arc_export_file_id=None,
+            status="new",
+            stats=stats,
         )
 
-    # Load the Arc export data and save it to the database.
-    with gzip.open(file_path, "rb") as file_obj:
-        timeline_items = json.load(file_obj)["timelineItems"]
+    arc_export_file_id, arc_export_file_data = arc_export_file_row
+
+    if quick_check and is_arc_export_file_unchanged(
+        file_stat, arc_export_file_data
+    ):
+        return ArcExportFilePlan(
+            file_path=file_path,
+            file_stat=file_stat,
+            file_checksum=None,
+            arc_export_file_id=arc_export_file_id,
+            status="unchanged",
+            stats=stats,
+        )
 
-    timeline_items, places, samples = (
-        extract_places_and_samples_from_timeline_items(timeline_items)
+    with stats.measure("checksum"):
+        file_checksum = calculate_file_checksum(file_path)
+    return ArcExportFilePlan(
+        file_path=file_path,
+        file_stat=file_stat,
+        file_checksum=file_checksum,
+        arc_export_file_id=arc_export_file_id,
+        status=(
+            "unchanged"
+            if arc_export_file_data["file_checksum"] == file_checksum
+            else "changed"
+        ),
+        stats=stats,
     )
 
-    places_table = get_table("places", db=db)
-    timeline_items_table = get_table("timeline_items", db=db)
-    samples_table = get_table("samples", db=db)
 
-    save_places(
-        places,
-        arc_export_file_id=arc_export_file_row_id,
-        places_table=places_table,
+def update_arc_export_file_signatures(
+    db: Database,
+    plans: t.Iterable[ArcExportFilePlan],
+    arc_export_files_index: t.Dict[str, t.Tuple[int, t.Dict[str, t.Any]]],
+) -> int:
+    """
+    Save the size, modification time and inode of the unchanged Arc export
+    files that had to be checksummed because they didn't match their
+    arc_export_files row (e.g. touched, re-downloaded or saved before these
+    were recorded), so ``quick_check`` can skip them next time. Returns how
+    many rows were updated.
+    """
+    table = get_table("arc_export_files", db=db)
+
+    updated = 0
+    with transaction(db):
+        for plan in plans:
+            if plan.status != "unchanged" or plan.file_checksum is None:
+                continue
+
+            arc_export_file_id, arc_export_file_data = arc_export_files_index[
+                plan.file_path.name
+            ]
+            if is_arc_export_file_unchanged(
+                plan.file_stat, arc_export_file_data
+            ):
+                continue
+
+            table.update(
+                arc_export_file_id,
+                {
+                    "file_size": plan.file_stat.st_size,
+                    "file_mtime_ns": plan.file_stat.st_mtime_ns,
+                    "file_inode": plan.file_stat.st_ino,
+                },
+            )
+            updated += 1
+
+    return updated
+
+
+def plan_arc_export_files(
+    file_paths: t.Iterable[Path],
+    arc_export_files_index: t.Dict[str, t.Tuple[int, t.Dict[str, t.Any]]],
+    quick_check: bool = False,
+    workers: int = 1,
+) -> t.Generator[ArcExportFilePlan, None, None]:
+    """
+    Plan many Arc export files against the preloaded arc_export_files index,
+    in the order they were given.
+
+    With more than one worker the files are hashed in a thread pool, hashlib
+    releases the GIL while it works.
+    """
+
+    def plan(file_path: Path) -> ArcExportFilePlan:
+        return plan_arc_export_file(
+            file_path,
+            arc_export_file_row=arc_export_files_index.get(file_path.name),
+            quick_check=quick_check,
+        )
+
+    if workers <= 1:
+        yield from map(plan, file_paths)
+        return
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        yield from executor.map(plan, file_paths)
+
+
+def prepare_arc_export_file(
+    plan: ArcExportFilePlan,
+    use_spatialite: bool = False,
+    use_simplified_paths: bool = False,
+    use_distances: bool = False,
+    stream: bool = False,
+) -> PreparedArcExportFile:
+    """
+    Get a new or changed Arc export file ready to be saved.
+
+    This doesn't touch the database, so it can be run in a worker process.
+    Unless ``stream`` is set the file is decoded and transformed here,
+    otherwise that is deferred until the batches are read.
+    """
+    stats = IngestStats()
+    batches: t.Iterable[ArcExportBatch] = iter_arc_export_file_batches(
+        plan.file_path,
         use_spatialite=use_spatialite,
+        use_simplified_paths=use_simplified_paths,
+        use_distances=use_distances,
+        stats=stats,
     )
-    save_timeline_items(
-        timeline_items,
-        arc_export_file_id=arc_export_file_row_id,
-        timeline_items_table=timeline_items_table,
+    if stream is False:
+        batches = list(batches)
+
+    return PreparedArcExportFile(plan=plan, batches=batches, stats=stats)
+
+
+def prepare_arc_export_files(
+    plans: t.Iterable[ArcExportFilePlan],
+    workers: int = 1,
+    use_spatialite: bool = False,
+    use_simplified_paths: bool = False,
+    use_distances: bool = False,
+) -> t.Generator[PreparedArcExportFile, None, None]:
+    """
+    Prepare many Arc export files, yielding them in the order they were given.
+
+    With a single worker the files are streamed as they are saved. With more
+    the files are prepared in a process pool, while the caller stays the only
+    one writing to the database. At most two files per worker are in flight at
+    a time to bound memory usage.
+    """
+    if workers <= 1:
+        for plan in plans:
+            yield prepare_arc_export_file(
+                plan,
+                use_spatialite=use_spatialite,
+                use_simplified_paths=use_simplified_paths,
+                use_distances=use_distances,
+                stream=True,
+            )
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending: t.Deque[Future[PreparedArcExportFile]] = deque()
+
+        for plan in plans:
+            pending.append(
+                executor.submit(
+                    prepare_arc_export_file,
+                    plan,
+                    use_spatialite=use_spatialite,
+                    use_simplified_paths=use_simplified_paths,
+                    use_distances=use_distances,
+                )
+            )
+
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+
+        while pending:
+            yield pending.popleft().result()
+
+
+def save_prepared_arc_export_file(
+    db: Database,
+    prepared: PreparedArcExportFile,
+    use_spatialite: bool = False,
+    partition_samples: bool = False,
+    compact_keys: bool = False,
+    daily_rollups: bool = True,
+    save_stats: bool = False,
+):
+    """
+    Save a prepared Arc export file to the SQLite database.
+
+    When the file has changed since it was last saved, only the places,
+    timeline items and samples whose last_saved_at has changed are saved
+    again, and the timeline items and samples that were saved from it before
+    but aren't in it anymore (merged or deleted in Arc) are deleted.
+
+    With ``daily_rollups`` the rollups are recomputed for the days the saved
+    and deleted timeline items started on, before and after they were saved.
+    With ``save_stats`` the time spent on each stage of processing the file
+    is saved to its arc_export_files row.
+    """
+    plan = prepared.plan
+    stats = prepared.stats
+    if plan.file_checksum is None:
+        raise ValueError(f"{plan.file_path.name} hasn't been checksummed.")
+
+    with transaction(db):
+        arc_export_files_table = save_arc_export_file(
+            plan.file_path,
+            file_checksum=plan.file_checksum,
+            row_id=plan.arc_export_file_id,
+            table=get_table("arc_export_files", db=db),
+            file_stat=plan.file_stat,
+        )
+        arc_export_file_id = arc_export_files_table.last_pk
+        if arc_export_file_id is None:
+            raise errors.ArcExportFilesRowFailedError(
+                "The arc_export_files row failed to save to the database."
+            )
+
+        # Looked up once for the whole file, before any of it is saved.
+        last_saved_at = None
+        if plan.status == "changed":
+            with stats.measure("lookup_last_saved_at"):
+                last_saved_at = get_arc_export_file_last_saved_at(
+                    db, arc_export_file_id
+                )
+
+        sample_id_index = get_sample_tuple_columns().index("sample_id")
+        seen_item_ids: t.Set[t.Any] = set()
+        seen_sample_ids: t.Set[t.Any] = set()
+
+        item_ids: t.List[t.Any] = []
+        rollup_days: t.Set[str] = set()
+        for batch in prepared.batches:
+            if compact_keys:
+                with stats.measure("compact_keys"):
+                    batch = compact_arc_export_batch_keys(db, batch)
+
+            if last_saved_at is not None:
+                seen_item_ids.update(
+                    row["item_id"] for row in batch.timeline_items
+                )
+                seen_sample_ids.update(
+                    sample[sample_id_index] for sample in batch.samples
+                )
+
+                rows = count_arc_export_batch_rows(batch)
+                with stats.measure("skip_unchanged"):
+                    batch = remove_unchanged_arc_export_batch_rows(
+                        batch, last_saved_at
+                    )
+                stats.add(
+                    "skip_unchanged",
+                    rows=rows - count_arc_export_batch_rows(batch),
+                )
+
+            item_ids.extend(row["item_id"] for row in batch.timeline_items)
+
+            # The days the timeline items were on before they're saved, in
+            # case they've moved to another day.
+            if daily_rollups:
+                with stats.measure("daily_rollups"):
+                    rollup_days |= get_timeline_item_days(
+                        db, [row["item_id"] for row in batch.timeline_items]
+                    )
+
+            with stats.measure("save_places", rows=len(batch.places)):
+                save_places(
+                    batch.places,
+                    arc_export_file_id=arc_export_file_id,
+                    places_table=get_table("places", db=db),
+                    use_spatialite=use_spatialite,
+                )
+            with stats.measure(
+                "save_timeline_items", rows=len(batch.timeline_items)
+            ):
+                save_timeline_items(
+                    batch.timeline_items,
+                    arc_export_file_id=arc_export_file_id,
+                    timeline_items_table=get_table("timeline_items", db=db),
+                    use_spatialite=use_spatialite,
+                )
+            with stats.measure("save_samples", rows=len(batch.samples)):
+                if partition_samples:
+                    save_partitioned_samples(
+                        batch.samples,
+                        arc_export_file_id=arc_export_file_id,
+                        db=db,
+                    )
+                else:
+                    save_samples(
+                        batch.samples,
+                        arc_export_file_id=arc_export_file_id,
+                        samples_table=get_table("samples", db=db),
+                        use_spatialite=use_spatialite,
+                    )
+
+        if last_saved_at is not None:
+            stale_item_ids = (
+                set(last_saved_at["timeline_items"]) - seen_item_ids
+            )
+            stale_sample_ids = set(last_saved_at["samples"]) - seen_sample_ids
+
+            with stats.measure("delete_stale"):
+                # The days are needed before the timeline items are gone.
+                if daily_rollups:
+                    rollup_days |= get_timeline_item_days(db, stale_item_ids)
+
+                deleted = delete_stale_arc_export_file_rows(
+                    db,
+                    stale_item_ids,
+                    stale_sample_ids,
+                    partition_samples=partition_samples,
+                )
+            stats.add("delete_stale", rows=deleted)
+
+        if daily_rollups:
+            with stats.measure("daily_rollups"):
+                rollup_days |= get_timeline_item_days(db, item_ids)
+                update_daily_rollups(db, rollup_days)
+
+        if save_stats:
+            file_stats = IngestStats()
+            file_stats.update(plan.stats)
+            file_stats.update(stats)
+            arc_export_files_table.update(
+                arc_export_file_id,
+                {"stats": json.dumps(file_stats.as_dict())},
+            )
+
+
+def process_arc_export_file(
+    db: Database,
+    file_path: Path,
+    use_spatialite: bool = False,
+    use_simplified_paths: bool = False,
+    partition_samples: bool = False,
+    compact_keys: bool = False,
+    daily_rollups: bool = True,
+    quick_check: bool = False,
+    save_stats: bool = False,
+):
+    """
+    Process an Arc export file and save the data to the SQLite database.
+
+    Everything is written in a single transaction, so a file is only ever
+    marked as processed in arc_export_files once all of its places, timeline
+    items and samples have been saved.
+    """
+    arc_export_file_row = get_arc_export_file_row(
+        file_path.name, get_table("arc_export_files", db=db)
+    )
+    plan = plan_arc_export_file(
+        file_path,
+        arc_export_file_row=arc_export_file_row,
+        quick_check=quick_check,
+    )
+    if plan.status == "unchanged":
+        if arc_export_file_row is not None:
+            update_arc_export_file_signatures(
+                db, [plan], {file_path.name: arc_export_file_row}
+            )
+        logger.info(
+            f"Skipping file {file_path.name} because it has already been "
+            f"processed."
+        )
+        return
+
+    prepared = prepare_arc_export_file(
+        plan,
         use_spatialite=use_spatialite,
+        use_simplified_paths=use_simplified_paths,
+        use_distances=daily_rollups,
+        stream=True,
     )
-    save_samples(
-        samples,
-        arc_export_file_id=arc_export_file_row_id,
-        samples_table=samples_table,
+    save_prepared_arc_export_file(
+        db,
+        prepared,
         use_spatialite=use_spatialite,
+        partition_samples=partition_samples,
+        compact_keys=compact_keys,
+        daily_rollups=daily_rollups,
+        save_stats=save_stats,
     )
@@ -1,314 +1,384 @@
 import datetime
+import os
 import re
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
 
-from shapely import LineString, Point
+import shapely
+from shapely import LineString
 
+from . import schema
 
-def convert_coordinates_to_wkt_point(*, latitude: str, longitude: str) -> str:
+
+def convert_coordinates_to_wkb_points(
+    coordinates: Iterable[Tuple[Any, Any]]
+) -> List[Optional[bytes]]:
     """
-    Convert a latitude and longitude to a Well-Known Text (WKT) string.
+    Convert latitude and longitude pairs to Well-Known Binary (WKB) Points,
+    all at once with shapely's vectorized functions. Pairs that are missing a
+    latitude or longitude are None.
     """
-    return Point(float(latitude), float(longitude)).wkt
+    coordinates = list(coordinates)
+    indexes = [
+        index
+        for index, (latitude, longitude) in enumerate(coordinates)
+        if latitude is not None and longitude is not None
+    ]
+
+    result: List[Optional[bytes]] = [None] * len(coordinates)
+    if not indexes:
+        return result
+
+    points = shapely.points(
+        [
+            (float(coordinates[index][1]), float(coordinates[index][0]))
+            for index in indexes
+        ]
+    )
+    for index, wkb in zip(indexes, shapely.to_wkb(points).tolist()):
+        result[index] = wkb
+
+    return result
 
 
-def convert_samples_to_wkt_line_string(
-    samples: List[Dict[str, Any]]
-) -> Optional[str]:
+def convert_coordinates_to_line_strings(
+    paths: Iterable[Iterable[Tuple[Any, Any]]]
+) -> List[Optional[LineString]]:
     """
-    Convert the latitude and longitude of a sample to a Well-Known Text (WKT)
-    string.
+    Convert sequences of latitude and longitude pairs to LineStrings, all at
+    once with shapely's vectorized functions. Paths with less than two points
+    are None.
     """
-    # Filter out any samples that do not have a location or latitude and
-    # longitude.
-    samples = [
-        sample
-        for sample in samples
-        if sample.get("location")
-        and sample["location"].get("latitude")
-        and sample["location"].get("longitude")
-    ]
+    coordinates: List[Tuple[float, float]] = []
+    indices: List[int] = []
+    path_indexes: List[int] = []
+
+    path_count = 0
+    for path_index, path in enumerate(paths):
+        path_count += 1
+        points = [
+            (float(longitude), float(latitude))
+            for latitude, longitude in path
+            if latitude and longitude
+        ]
+        if len(points) <= 1:
+            continue
 
-    # If there is less than one sample, return None, as a LineString requires
-    # at least two points.
-    if len(samples) <= 1:
-        return None
-
-    points = [
-        Point(
-            float(sample["location"]["latitude"]),
-            float(sample["location"]["longitude"]),
-        )
-        for sample in samples
-    ]
-    return LineString(points).wkt
+        coordinates.extend(points)
+        indices.extend([len(path_indexes)] * len(points))
+        path_indexes.append(path_index)
+
+    result: List[Optional[LineString]] = [None] * path_count
+    if not path_indexes:
+        return result
 
+    # With indices this is always an array, rather than a single LineString.
+    line_strings: Any = shapely.linestrings(coordinates, indices=indices)
+    for index, line_string in zip(path_indexes, line_strings.tolist()):
+        result[index] = line_string
 
-def convert_to_snake_case(name: str) -> str:
+    return result
+
+
+def convert_coordinates_to_wkb_line_strings(
+    paths: Iterable[Iterable[Tuple[Any, Any]]]
+) -> List[Optional[bytes]]:
+    """
+    Convert sequences of latitude and longitude pairs to Well-Known Binary
+    (WKB) LineStrings. Paths with less than two points are None.
     """
-    Convert a string to snake_case.
+    line_strings = convert_coordinates_to_line_strings(paths)
+    if not line_strings:
+        return []
+
+    return shapely.to_wkb(line_strings).tolist()
+
 
-    - Adapted from this StackOverflow response:
-      http://stackoverflow.com/a/1176023/1072990
+def encode_polyline(
+    coordinates: Iterable[Tuple[float, float]], precision: int = 5
+) -> str:
     """
-    s1 = re.sub("(.)([A-Z][a-z]+)", r"\1_\2", name)
-    return re.sub("([a-z0-9])([A-Z])", r"\1_\2", s1).lower()
+    Encode latitude and longitude pairs with Google's Encoded Polyline
+    Algorithm Format, which most web mapping libraries can decode.
+    """
+    factor = 10**precision
+    result = []
+    previous = [0, 0]
+
+    for pair in coordinates:
+        for axis, value in enumerate(pair):
+            scaled = round(value * factor)
+            delta = scaled - previous[axis]
+            previous[axis] = scaled
+
+            delta = ~(delta << 1) if delta < 0 else delta << 1
+            while delta >= 0x20:
+                result.append(chr((0x20 | (delta & 0x1F)) + 63))
+                delta >>= 5
+            result.append(chr(delta + 63))
+
+    return "".join(result)
 
 
-def transform_place(place: Dict[str, Any], use_spatialite: bool = False):
+def convert_line_strings_to_simplified_polylines(
+    line_strings: List[Optional[LineString]], tolerance: float
+) -> List[Optional[str]]:
     """
-    Transform the place data from the Arc JSON to the SQLite schema.
+    Simplify LineStrings with the Douglas-Peucker algorithm, all at once with
+    shapely's vectorized functions, and encode them as polylines. The
+    ``tolerance`` is in degrees.
     """
-    place["last_saved_at"] = place.pop("lastSaved")
-
-    radius = place.pop("radius")
-    for key, value in radius.items():
-        place[f"radius_{convert_to_snake_case(key)}"] = value
-
-    center = place.pop("center")
-    for key, value in center.items():
-        place[convert_to_snake_case(key)] = value
-
-    # Convert the keys to snake_case
-    to_convert = [
-        k
-        for k in place.keys()
-        if k
-        in (
-            "placeId",
-            "streetAddress",
-            "secondsFromGMT",
-            "mapboxCategory",
-            "mapboxPlaceId",
-            "googlePrimaryType",
-            "googlePlaceId",
-        )
-    ]
-    for key in to_convert:
-        if key in place:
-            place[convert_to_snake_case(key)] = place.pop(key)
-
-    # Remove any keys that are not in the schema
-    to_remove = [
-        k
-        for k in place.keys()
-        if k
-        not in (
-            "place_id",
-            "name",
-            "street_address",
-            "latitude",
-            "longitude",
-            "radius_sd",
-            "radius_mean",
-            "seconds_from_gmt",
-            "last_saved_at",
-            "mapbox_category",
-            "mapbox_place_id",
-            "google_primary_type",
-            "google_place_id",
-        )
-    ]
-    for key in to_remove:
-        place.pop(key)
+    result: List[Optional[str]] = [None] * len(line_strings)
+    if not line_strings:
+        return result
+
+    simplified = shapely.simplify(
+        line_strings, tolerance, preserve_topology=False
+    )
+    coordinates, indexes = shapely.get_coordinates(
+        simplified, return_index=True
+    )
+
+    paths: Dict[int, List[Tuple[float, float]]] = {}
+    for (longitude, latitude), index in zip(
+        coordinates.tolist(), indexes.tolist()
+    ):
+        paths.setdefault(index, []).append((latitude, longitude))
 
-    if use_spatialite and "latitude" in place and "longitude" in place:
-        place["coordinates"] = convert_coordinates_to_wkt_point(
-            latitude=place["latitude"], longitude=place["longitude"]
-        )
+    for index, path in paths.items():
+        result[index] = encode_polyline(path)
 
-    return place
+    return result
 
 
-def transform_sample(sample: Dict[str, Any], use_spatialite: bool = False):
+def convert_to_camel_case(name: str) -> str:
     """
-    Transform the sample data from the Arc JSON to the SQLite schema.
+    Convert a snake_case string to camelCase.
     """
-    sample["taken_at"] = sample.pop("date")
-    sample["last_saved_at"] = sample.pop("lastSaved")
-
-    # Extract the location data
-    location = sample.pop("location", None) or {}
-    location.pop("timestamp", None)
-    for key, value in location.items():
-        sample[convert_to_snake_case(key)] = value
-
-    # Convert the keys to snake_case
-    to_convert = [
-        "courseVariance",
-        "zAcceleration",
-        "secondsFromGMT",
-        "sampleId",
-        "movingState",
-        "xyAcceleration",
-        "recordingState",
-        "stepHz",
-        "timelineItemId",
-    ]
-    for key in to_convert:
-        if key not in sample:
-            continue
+    first, *rest = name.split("_")
+    return first + "".join(part.title() for part in rest)
 
-        sample[convert_to_snake_case(key)] = sample.pop(key)
-
-    # Remove any keys that are not in the schema
-    to_remove = [
-        k
-        for k in sample.keys()
-        if k
-        not in (
-            "latitude",
-            "longitude",
-            "speed",
-            "timestamp",
-            "horizontal_accuracy",
-            "vertical_accuracy",
-            "altitude",
-            "course",
-            "horizontal_accuracy",
-            "vertical_accuracy",
-            "speed",
-            "longitude",
-            "latitude",
-            "seconds_from_gmt",
-            "sample_id",
-            "moving_state",
-            "xy_acceleration",
-            "recording_state",
-            "step_hz",
-            "timeline_item_id",
-            "course_variance",
-            "z_acceleration",
-            "last_saved_at",
-            "taken_at",
-        )
-    ]
-    for key in to_remove:
-        if key not in sample:
-            continue
 
-        sample.pop(key)
+# A mapping of Arc JSON keys to columns. Nested objects (like a place's center)
+# map their key to a mapping of the nested object's keys.
+KeyMapping = Dict[str, Union[str, Dict[str, str]]]
 
-    if use_spatialite and "latitude" in sample and "longitude" in sample:
-        sample["coordinates"] = convert_coordinates_to_wkt_point(
-            latitude=sample["latitude"], longitude=sample["longitude"]
-        )
 
-    return sample
+def build_key_mapping(
+    columns: Iterable[str],
+    renames: Dict[str, str],
+    nested: Dict[str, Tuple[str, Iterable[str]]],
+) -> KeyMapping:
+    """
+    Build the mapping of Arc JSON keys to the columns of a table.
 
+    Columns are found under their camelCase name unless they are renamed, or
+    are one of the ``nested`` columns, which are found in the nested object's
+    keys after the column prefix (e.g. radius_sd is ``radius.sd``).
+    """
+    mapping: KeyMapping = {}
+    nested_columns = {
+        column: (parent, prefix)
+        for parent, (prefix, parent_columns) in nested.items()
+        for column in parent_columns
+    }
 
-def transform_timeline_item(
-    timeline_item: Dict[str, Any], use_spatialite: bool = False
-):
+    for column in columns:
+        if column in renames:
+            mapping[renames[column]] = column
+        elif column in nested_columns:
+            parent, prefix = nested_columns[column]
+            key = convert_to_camel_case(column[len(prefix) :])
+            mapping.setdefault(parent, {})[key] = column  # type: ignore
+        else:
+            mapping[convert_to_camel_case(column)] = column
+
+    return mapping
+
+
+# The columns that are set when saving rows, rather than from the Arc JSON.
+SAVED_COLUMNS = ("arc_export_file_id", "created_at", "updated_at")
+
+PLACE_KEYS = build_key_mapping(
+    (c for c in schema.PLACES_COLUMNS if c not in SAVED_COLUMNS),
+    renames={
+        "last_saved_at": "lastSaved",
+        "seconds_from_gmt": "secondsFromGMT",
+    },
+    nested={
+        "center": ("", ("latitude", "longitude")),
+        "radius": ("radius_", ("radius_sd", "radius_mean")),
+    },
+)
+
+SAMPLE_KEYS = build_key_mapping(
+    (c for c in schema.SAMPLES_COLUMNS if c not in SAVED_COLUMNS),
+    renames={
+        "taken_at": "date",
+        "last_saved_at": "lastSaved",
+        "seconds_from_gmt": "secondsFromGMT",
+    },
+    nested={
+        "location": (
+            "",
+            (
+                "latitude",
+                "longitude",
+                "altitude",
+                "course",
+                "speed",
+                "horizontal_accuracy",
+                "vertical_accuracy",
+            ),
+        ),
+    },
+)
+
+TIMELINE_ITEM_KEYS = build_key_mapping(
+    (c for c in schema.TIMELINE_ITEMS_COLUMNS if c not in SAVED_COLUMNS),
+    renames={
+        "starts_at": "startDate",
+        "ends_at": "endDate",
+        "last_saved_at": "lastSaved",
+        "seconds_from_gmt": "secondsFromGMT",
+    },
+    nested={
+        "center": ("", ("latitude", "longitude")),
+        "radius": ("radius_", ("radius_sd", "radius_mean")),
+    },
+)
+
+
+def transform_with_key_mapping(
+    data: Dict[str, Any], key_mapping: KeyMapping
+) -> Dict[str, Any]:
     """
-    Transform the timeline item data from the Arc JSON to the SQLite schema.
+    Build a row from Arc JSON data in a single pass over its keys, dropping
+    any keys that aren't in the schema.
     """
-    timeline_item["last_saved_at"] = timeline_item.pop("lastSaved")
-    timeline_item["starts_at"] = timeline_item.pop("startDate")
-    timeline_item["ends_at"] = timeline_item.pop("endDate")
-
-    center = timeline_item.pop("center", None) or {}
-    for key, value in center.items():
-        timeline_item[convert_to_snake_case(key)] = value
-
-    radius = timeline_item.pop("radius", None) or {}
-    for key, value in radius.items():
-        timeline_item[f"radius_{convert_to_snake_case(key)}"] = value
-
-    samples = timeline_item.pop("samples", [])
-
-    # Convert the keys to snake_case
-    to_convert = [
-        "hkStepCount",
-        "floorsAscended",
-        "altitude",
-        "averageHeartRate",
-        "streetAddress",
-        "isVisit",
-        "manualPlace",
-        "maxHeartRate",
-        "stepCount",
-        "nextItemId",
-        "placeId",
-        "previousItemId",
-        "floorsDescended",
-        "activeEnergyBurned",
-        "itemId",
-        "activityType",
-        "activityTypeConfidenceScore",
-        "manualActivityType",
-        "uncertainActivityType",
-        "unknownActivityType",
-    ]
-    for key in to_convert:
-        if key not in timeline_item:
+    row = {}
+    for key, value in data.items():
+        column = key_mapping.get(key)
+        if column is None:
             continue
 
-        timeline_item[convert_to_snake_case(key)] = timeline_item.pop(key)
-
-    # Remove any keys that are not in the schema
-    to_remove = [
-        k
-        for k in timeline_item.keys()
-        if k
-        not in (
-            "latitude",
-            "longitude",
-            "radius_sd",
-            "radius_mean",
-            "hk_step_count",
-            "floors_ascended",
-            "altitude",
-            "average_heart_rate",
-            "street_address",
-            "last_saved_at",
-            "is_visit",
-            "manual_place",
-            "starts_at",
-            "max_heart_rate",
-            "step_count",
-            "next_item_id",
-            "ends_at",
-            "place_id",
-            "previous_item_id",
-            "floors_descended",
-            "active_energy_burned",
-            "item_id",
-            "last_saved_at",
-            "activity_type",
-            "activity_type_confidence_score",
-            "manual_activity_type",
-            "uncertain_activity_type",
-            "unknown_activity_type",
-        )
-    ]
-    for key in to_remove:
-        timeline_item.pop(key)
+        if isinstance(column, str):
+            row[column] = value
+        elif value:
+            for nested_key, nested_value in value.items():
+                nested_column = column.get(nested_key)
+                if nested_column is not None:
+                    row[nested_column] = nested_value
+
+    return row
 
+
+class TupleSpec(NamedTuple):
+    """
+    How to build a row tuple from Arc JSON data: the top-level keys, then the
+    keys of each nested object, giving values in the order of the columns.
+    """
+
+    columns: Tuple[str, ...]
+    keys: Tuple[str, ...]
+    nested: Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+
+def build_tuple_spec(key_mapping: KeyMapping) -> TupleSpec:
+    """
+    Build the tuple spec for a key mapping.
+    """
+    keys: List[str] = []
+    key_columns: List[str] = []
+    nested: List[Tuple[str, Tuple[str, ...]]] = []
+    nested_columns: List[str] = []
+    for key, column in key_mapping.items():
+        if isinstance(column, dict):
+            nested.append((key, tuple(column)))
+            nested_columns.extend(column.values())
+        else:
+            keys.append(key)
+            key_columns.append(column)
+
+    return TupleSpec(
+        columns=tuple(key_columns + nested_columns),
+        keys=tuple(keys),
+        nested=tuple(nested),
+    )
+
+
+SAMPLE_TUPLE_SPEC = build_tuple_spec(SAMPLE_KEYS)
+
+
+def transform_with_tuple_spec(
+    data: Dict[str, Any], tuple_spec: TupleSpec
+) -> Tuple[Any, ...]:
+    """
+    Build a row tuple from Arc JSON data, missing values are None.
+    """
+    row = [data.get(key) for key in tuple_spec.keys]
+    for parent, nested_keys in tuple_spec.nested:
+        nested = data.get(parent) or {}
+        row.extend([nested.get(key) for key in nested_keys])
+
+    return tuple(row)
+
+
+def transform_place(place: Dict[str, Any]):
+    """
+    Transform the place data from the Arc JSON to the SQLite schema.
+    """
+    return transform_with_key_mapping(place, PLACE_KEYS)
+
+
+def transform_sample(sample: Dict[str, Any]):
+    """
+    Transform the sample data from the Arc JSON to the SQLite schema.
+    """
+    return transform_with_key_mapping(sample, SAMPLE_KEYS)
+
+
+def get_sample_tuple_columns(use_spatialite: bool = False) -> Tuple[str, ...]:
+    """
+    The columns of the tuples returned by ``transform_sample_to_tuple``, and
+    with ``use_spatialite`` the coordinates added to them for SpatiaLite.
+    """
     if use_spatialite:
-        if "latitude" in timeline_item and "longitude" in timeline_item:
-            timeline_item["coordinates"] = convert_coordinates_to_wkt_point(
-                latitude=timeline_item["latitude"],
-                longitude=timeline_item["longitude"],
-            )
+        return SAMPLE_TUPLE_SPEC.columns + ("coordinates",)
 
-        if samples:
-            timeline_item["samples_path"] = convert_samples_to_wkt_line_string(
-                samples
-            )
+    return SAMPLE_TUPLE_SPEC.columns
 
-    return timeline_item
+
+def transform_sample_to_tuple(sample: Dict[str, Any]) -> Tuple[Any, ...]:
+    """
+    Transform the sample data from the Arc JSON to a tuple of values in the
+    order of ``get_sample_tuple_columns``.
+
+    This is the same as ``transform_sample`` without building a dictionary
+    per sample, as there are a lot of them.
+    """
+    return transform_with_tuple_spec(sample, SAMPLE_TUPLE_SPEC)
+
+
+def transform_timeline_item(timeline_item: Dict[str, Any]):
+    """
+    Transform the timeline item data from the Arc JSON to the SQLite schema.
+    """
+    return transform_with_key_mapping(timeline_item, TIMELINE_ITEM_KEYS)
 
 
 def transform_arc_export_file_path(
     path: Path,
     file_checksum: str,
+    file_stat: Optional[os.stat_result] = None,
 ) -> Dict[str, Any]:
     """
     Transform an Arc export file path into a dictionary of values that can be
     safely inserted into the arc_export_files table.
     """
+    if file_stat is None:
+        file_stat = path.stat()
+
     # Determine the export type based on the file name.
     file_basename = path.name.split(".")[0]
 
@@ -322,7 +392,9 @@ def transform_arc_export_file_path(
     return {
         "file_name": path.name,
         "file_path": str(path.absolute()),
-        "file_size": path.stat().st_size,
+        "file_size": file_stat.st_size,
+        "file_mtime_ns": file_stat.st_mtime_ns,
+        "file_inode": file_stat.st_ino,
         "file_checksum": file_checksum,
         "export_type": export_type,
         "last_processed_at": datetime.datetime.now(tz=datetime.timezone.utc),
@@ -0,0 +1,297 @@
+"""
+Generate a synthetic Arc export, in the Documents/Export/JSON/{Daily,Monthly}
+layout that arc-to-sqlite reads.
+
+    python -m benchmarks.generate_export /tmp/arc --days 30 --items-per-day 20
+
+The timeline alternates between visits to a fixed pool of places and trips
+between them, with the samples on a random walk around Toronto. The same
+seed always generates the same export.
+"""
+
+import argparse
+import gzip
+import json
+import random
+import typing as t
+import uuid
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+
+SECONDS_FROM_GMT = -14400
+CENTER = (-79.4, 43.65)
+ACTIVITY_TYPES = ("walking", "cycling", "car", "bus", "running")
+
+
+def format_date(value: datetime) -> str:
+    return value.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+class ExportGenerator:
+    """
+    Generate the timeline items of a synthetic Arc export, day by day.
+    """
+
+    def __init__(
+        self,
+        items_per_day: int = 20,
+        samples_per_item: int = 50,
+        places: int = 25,
+        seed: int = 0,
+    ):
+        self.items_per_day = items_per_day
+        self.samples_per_item = samples_per_item
+        self.random = random.Random(seed)
+        self.places = [self.generate_place(index) for index in range(places)]
+        self.previous_item: t.Optional[t.Dict[str, t.Any]] = None
+
+    def generate_id(self) -> str:
+        return str(
+            uuid.UUID(int=self.random.getrandbits(128), version=4)
+        ).upper()
+
+    def generate_coordinates(
+        self, longitude: float, latitude: float, spread: float
+    ) -> t.Tuple[float, float]:
+        return (
+            longitude + self.random.uniform(-spread, spread),
+            latitude + self.random.uniform(-spread, spread),
+        )
+
+    def generate_place(self, index: int) -> t.Dict[str, t.Any]:
+        longitude, latitude = self.generate_coordinates(*CENTER, spread=0.05)
+        return {
+            "placeId": self.generate_id(),
+            "secondsFromGMT": SECONDS_FROM_GMT,
+            "radius": {
+                "sd": self.random.uniform(1, 10),
+                "mean": self.random.uniform(10, 100),
+            },
+            "streetAddress": f"{index + 1} Queen St W",
+            "mapboxCategory": "shop",
+            "name": f"Place {index + 1}",
+            "mapboxPlaceId": f"poi.{self.random.getrandbits(32)}",
+            "lastSaved": "2024-06-01T00:00:00Z",
+            "center": {"longitude": longitude, "latitude": latitude},
+        }
+
+    def generate_sample(
+        self,
+        timeline_item_id: str,
+        taken_at: datetime,
+        longitude: float,
+        latitude: float,
+        moving_state: str,
+    ) -> t.Dict[str, t.Any]:
+        return {
+            "courseVariance": self.random.random(),
+            "date": format_date(taken_at),
+            "lastSaved": format_date(taken_at + timedelta(minutes=5)),
+            "location": {
+                "course": self.random.uniform(0, 360),
+                "timestamp": format_date(taken_at),
+                "speed": self.random.uniform(0, 5),
+                "altitude": self.random.uniform(80, 100),
+                "verticalAccuracy": self.random.uniform(3, 15),
+                "longitude": longitude,
+                "horizontalAccuracy": self.random.uniform(3, 30),
+                "latitude": latitude,
+            },
+            "movingState": moving_state,
+            "recordingState": "recording",
+            "sampleId": self.generate_id(),
+            "secondsFromGMT": SECONDS_FROM_GMT,
+            "stepHz": self.random.uniform(0, 2),
+            "timelineItemId": timeline_item_id,
+            "xyAcceleration": self.random.uniform(0, 4),
+            "zAcceleration": self.random.uniform(0, 3),
+        }
+
+    def generate_timeline_item(
+        self, starts_at: datetime, ends_at: datetime, is_visit: bool
+    ) -> t.Dict[str, t.Any]:
+        item_id = self.generate_id()
+        step_count = self.random.randint(0, 2000)
+        item: t.Dict[str, t.Any] = {
+            "itemId": item_id,
+            "isVisit": is_visit,
+            "startDate": format_date(starts_at),
+            "endDate": format_date(ends_at),
+            "lastSaved": format_date(ends_at + timedelta(minutes=5)),
+            "stepCount": step_count,
+            "hkStepCount": step_count,
+            "floorsAscended": self.random.randint(0, 3),
+            "floorsDescended": self.random.randint(0, 3),
+            "activeEnergyBurned": self.random.uniform(0, 200),
+            "averageHeartRate": self.random.uniform(60, 120),
+            "maxHeartRate": self.random.randint(100, 160),
+            "altitude": self.random.uniform(80, 100),
+        }
+
+        if is_visit:
+            place = self.random.choice(self.places)
+            longitude = place["center"]["longitude"]
+            latitude = place["center"]["latitude"]
+            item.update(
+                {
+                    "place": place,
+                    "placeId": place["placeId"],
+                    "manualPlace": False,
+                    "streetAddress": place["streetAddress"],
+                    "radius": place["radius"],
+                    "center": place["center"],
+                }
+            )
+            spread = 0.0002
+        else:
+            longitude, latitude = self.generate_coordinates(
+                *CENTER, spread=0.05
+            )
+            item.update(
+                {
+                    "activityType": self.random.choice(ACTIVITY_TYPES),
+                    "activityTypeConfidenceScore": self.random.uniform(0, 100),
+                    "manualActivityType": False,
+                    "uncertainActivityType": False,
+                    "unknownActivityType": False,
+                }
+            )
+            spread = 0.001
+
+        interval = (ends_at - starts_at) / max(self.samples_per_item, 1)
+        samples = []
+        for index in range(self.samples_per_item):
+            # Visits jitter around the place, trips wander off.
+            if is_visit:
+                coordinates = self.generate_coordinates(
+                    longitude, latitude, spread
+                )
+            else:
+                longitude, latitude = self.generate_coordinates(
+                    longitude, latitude, spread
+                )
+                coordinates = (longitude, latitude)
+            samples.append(
+                self.generate_sample(
+                    item_id,
+                    starts_at + interval * index,
+                    *coordinates,
+                    moving_state="stationary" if is_visit else "moving",
+                )
+            )
+        item["samples"] = samples
+
+        if self.previous_item is not None:
+            item["previousItemId"] = self.previous_item["itemId"]
+            self.previous_item["nextItemId"] = item_id
+        self.previous_item = item
+
+        return item
+
+    def generate_day(self, day: date) -> t.List[t.Dict[str, t.Any]]:
+        """
+        Generate a day of timeline items, alternating visits and trips.
+        """
+        day_starts_at = datetime(
+            day.year, day.month, day.day, tzinfo=timezone.utc
+        ) - timedelta(seconds=SECONDS_FROM_GMT)
+        duration = timedelta(days=1) / self.items_per_day
+        return [
+            self.generate_timeline_item(
+                day_starts_at + duration * index,
+                day_starts_at + duration * (index + 1),
+                is_visit=index % 2 == 0,
+            )
+            for index in range(self.items_per_day)
+        ]
+
+
+def write_export_file(
+    file_path: Path, timeline_items: t.List[t.Dict[str, t.Any]]
+):
+    with gzip.open(file_path, "wt") as file_obj:
+        json.dump({"timelineItems": timeline_items}, file_obj)
+
+
+def generate_export(
+    root_dir: Path,
+    start: date = date(2024, 1, 1),
+    days: int = 30,
+    items_per_day: int = 20,
+    samples_per_item: int = 50,
+    places: int = 25,
+    seed: int = 0,
+) -> t.Dict[str, int]:
+    """
+    Write the daily and monthly export files for the given number of days
+    under root_dir, returning how many files, timeline items and samples
+    there are of each.
+    """
+    daily_path = root_dir / "Documents/Export/JSON/Daily"
+    monthly_path = root_dir / "Documents/Export/JSON/Monthly"
+    daily_path.mkdir(parents=True, exist_ok=True)
+    monthly_path.mkdir(parents=True, exist_ok=True)
+
+    generator = ExportGenerator(
+        items_per_day=items_per_day,
+        samples_per_item=samples_per_item,
+        places=places,
+        seed=seed,
+    )
+
+    months: t.Dict[str, t.List[t.Dict[str, t.Any]]] = {}
+    for offset in range(days):
+        day = start + timedelta(days=offset)
+        timeline_items = generator.generate_day(day)
+        write_export_file(
+            daily_path / f"{day.isoformat()}.json.gz", timeline_items
+        )
+        months.setdefault(day.strftime("%Y-%m"), []).extend(timeline_items)
+
+    for month, timeline_items in months.items():
+        write_export_file(monthly_path / f"{month}.json.gz", timeline_items)
+
+    return {
+        "daily_files": days,
+        "monthly_files": len(months),
+        "timeline_items": days * items_per_day,
+        "samples": days * items_per_day * samples_per_item,
+    }
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument(
+        "--start", type=date.fromisoformat, default="2024-01-01"
+    )
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--items-per-day", type=int, default=20)
+    parser.add_argument("--samples-per-item", type=int, default=50)
+    parser.add_argument("--places", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=0)
+    return parser
+
+
+def main():
+    parser = get_parser()
+    parser.add_argument("root_dir", type=Path)
+    args = parser.parse_args()
+
+    counts = generate_export(
+        args.root_dir,
+        start=args.start,
+        days=args.days,
+        items_per_day=args.items_per_day,
+        samples_per_item=args.samples_per_item,
+        places=args.places,
+        seed=args.seed,
+    )
+    print(
+        f"{counts['daily_files']} daily and {counts['monthly_files']} "
+        f"monthly files, {counts['timeline_items']} timeline items, "
+        f"{counts['samples']} samples"
+    )
+
+
+if __name__ == "__main__":
+    main()
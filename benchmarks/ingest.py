@@ -0,0 +1,114 @@
+"""
+Benchmark ingesting a synthetic Arc export with the arc-to-sqlite command, in
+plain and SpatiaLite modes, for the daily and monthly exports.
+
+    python -m benchmarks.ingest --days 30 --items-per-day 20
+
+Each run is a fresh database in its own process, so the peak RSS is only
+that run's. SpatiaLite runs are skipped if the extension isn't available.
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from arc_to_sqlite import service
+
+from .generate_export import generate_export, get_parser
+
+MODES = {
+    "plain": [],
+    "spatialite": ["--spatialite"],
+}
+
+
+def run_ingest(db_path: Path, root_dir: Path, export_type: str, options):
+    """
+    Run arc-to-sqlite in a child process, returning the wall time and the
+    peak RSS in MiB of it and its worker processes.
+    """
+    command = [
+        sys.executable,
+        "-c",
+        "from arc_to_sqlite.cli import cli; cli()",
+        str(db_path),
+        str(root_dir),
+        "--export-type",
+        export_type,
+        *options,
+    ]
+
+    started_at = time.perf_counter()
+    process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+    _, status, rusage = os.wait4(process.pid, 0)
+    elapsed = time.perf_counter() - started_at
+
+    if os.waitstatus_to_exitcode(status) != 0:
+        raise RuntimeError(f"arc-to-sqlite failed: {' '.join(command)}")
+
+    # ru_maxrss is in KiB on Linux and bytes on macOS.
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return elapsed, rusage.ru_maxrss / scale
+
+
+def main():
+    parser = get_parser()
+    parser.add_argument(
+        "--option",
+        action="append",
+        default=[],
+        dest="options",
+        help="Extra option to pass to arc-to-sqlite, e.g. --option=--rtree.",
+    )
+    args = parser.parse_args()
+
+    modes = dict(MODES)
+    if service.check_spatialite_support() is False:
+        print("SpatiaLite isn't available, skipping the spatialite runs.")
+        del modes["spatialite"]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        root_dir = Path(temp_dir) / "arc"
+        counts = generate_export(
+            root_dir,
+            start=args.start,
+            days=args.days,
+            items_per_day=args.items_per_day,
+            samples_per_item=args.samples_per_item,
+            places=args.places,
+            seed=args.seed,
+        )
+        print(
+            f"{counts['daily_files']} daily and {counts['monthly_files']} "
+            f"monthly files, {counts['timeline_items']} timeline items, "
+            f"{counts['samples']} samples"
+        )
+        print(
+            f"{'mode':<12} {'export':<8} {'time':>8} {'files/s':>9} "
+            f"{'samples/s':>10} {'peak RSS':>10} {'db size':>10}"
+        )
+
+        for mode, options in modes.items():
+            for export_type in ("daily", "monthly"):
+                db_path = Path(temp_dir) / f"{mode}-{export_type}.db"
+                elapsed, peak_rss = run_ingest(
+                    db_path,
+                    root_dir,
+                    export_type,
+                    [*options, *args.options],
+                )
+                files = counts[f"{export_type}_files"]
+                db_size = db_path.stat().st_size / 1024 / 1024
+                print(
+                    f"{mode:<12} {export_type:<8} {elapsed:>7.2f}s "
+                    f"{files / elapsed:>9.1f} "
+                    f"{counts['samples'] / elapsed:>10.0f} "
+                    f"{peak_rss:>6.1f} MiB {db_size:>6.1f} MiB"
+                )
+
+
+if __name__ == "__main__":
+    main()
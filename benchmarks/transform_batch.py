@@ -0,0 +1,96 @@
+"""
+Benchmark transforming a month of timeline items with and without copying
+each timeline item's samples.
+
+    python -m benchmarks.transform_batch
+"""
+
+import json
+import time
+import tracemalloc
+import uuid
+from copy import deepcopy
+
+from arc_to_sqlite import service, transformers
+from tests import fixtures
+
+DAYS = 30
+ITEMS_PER_DAY = 10
+SAMPLES_PER_ITEM = 40
+
+
+def build_monthly_export():
+    """
+    Build a month of timeline items out of the test fixtures, as JSON.
+    """
+    timeline_items = []
+    for _ in range(DAYS * ITEMS_PER_DAY):
+        item = deepcopy(fixtures.TIMELINE_ITEM_TWO)
+        item["itemId"] = str(uuid.uuid4()).upper()
+        item["samples"] = []
+        for _ in range(SAMPLES_PER_ITEM):
+            sample = deepcopy(fixtures.SAMPLE_TWO)
+            sample["sampleId"] = str(uuid.uuid4()).upper()
+            sample["timelineItemId"] = item["itemId"]
+            item["samples"].append(sample)
+        timeline_items.append(item)
+    return json.dumps(timeline_items)
+
+
+def transform_with_deepcopy(export):
+    """
+    The previous pipeline: copy every timeline item's samples, so the raw
+    samples were still around for the timeline item transform.
+    """
+    timeline_items = json.loads(export)
+    places, samples = [], []
+    for item in timeline_items:
+        places.append(item.pop("place"))
+        samples.extend(deepcopy(item["samples"]))
+
+    return (
+        [transformers.transform_place(place) for place in places],
+        [transformers.transform_timeline_item(item) for item in timeline_items],
+        [transformers.transform_sample(sample) for sample in samples],
+    )
+
+
+def transform_shared(export):
+    return service.transform_arc_export_batch(json.loads(export))
+
+
+def transform_spatialite(export):
+    return service.transform_arc_export_batch(
+        json.loads(export), use_spatialite=True
+    )
+
+
+def measure(name, function):
+    # Time and memory are measured in separate runs, as tracing allocations
+    # slows everything down.
+    export = build_monthly_export()
+
+    started_at = time.perf_counter()
+    function(export)
+    elapsed = time.perf_counter() - started_at
+
+    tracemalloc.start()
+    function(export)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name:<10} {elapsed:>8.2f}s {peak / 1024 / 1024:>10.1f} MiB peak")
+
+
+def main():
+    print(
+        f"{DAYS * ITEMS_PER_DAY} timeline items, "
+        f"{DAYS * ITEMS_PER_DAY * SAMPLES_PER_ITEM} samples"
+    )
+    measure("deepcopy", transform_with_deepcopy)
+    measure("shared", transform_shared)
+    measure("spatialite", transform_spatialite)
+
+
+if __name__ == "__main__":
+    main()
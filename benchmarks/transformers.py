@@ -0,0 +1,44 @@
+"""
+Microbenchmark the row transformers, in rows per second.
+
+    python -m benchmarks.transformers
+"""
+
+import timeit
+from copy import deepcopy
+
+from arc_to_sqlite import transformers
+from tests import fixtures
+
+ROWS = 5_000
+
+
+def measure(name, function, row):
+    rows = [deepcopy(row) for _ in range(ROWS)]
+    iterator = iter(rows)
+
+    # The copies are made up front, as the transformers may change the row
+    # they are given.
+    elapsed = timeit.timeit(lambda: function(next(iterator)), number=ROWS)
+    print(f"{name:<26} {ROWS / elapsed:>12,.0f} rows/s")
+
+
+def main():
+    measure(
+        "transform_sample", transformers.transform_sample, fixtures.SAMPLE_ONE
+    )
+    measure(
+        "transform_sample_to_tuple",
+        transformers.transform_sample_to_tuple,
+        fixtures.SAMPLE_ONE,
+    )
+    measure("transform_place", transformers.transform_place, fixtures.PLACE_ONE)
+    measure(
+        "transform_timeline_item",
+        transformers.transform_timeline_item,
+        fixtures.TIMELINE_ITEM_FOUR,
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,38 @@
+import gzip
+import json
+import sqlite3
+
 import pytest
 from click.testing import CliRunner
 from sqlite_utils.db import Database
 
+from arc_to_sqlite import service
+
+from . import fixtures
+
 
 @pytest.fixture
 def mock_db() -> Database:
-    db = Database(memory=True)
+    db = Database(sqlite3.connect(":memory:", factory=service.ArcConnection))
     return db
 
 
 @pytest.fixture
 def cli_runner():
     return CliRunner()
+
+
+@pytest.fixture
+def arc_root_dir(tmp_path):
+    daily_path = tmp_path / "Documents/Export/JSON/Daily"
+    daily_path.mkdir(parents=True)
+
+    with gzip.open(daily_path / "2024-05-21.json.gz", "wt") as file_obj:
+        json.dump(fixtures.DAILY_EXPORT, file_obj)
+
+    return tmp_path
+
+
+@pytest.fixture
+def arc_export_file_path(arc_root_dir):
+    return arc_root_dir / "Documents/Export/JSON/Daily/2024-05-21.json.gz"
@@ -0,0 +1,276 @@
+import gzip
+import json
+import logging
+import pstats
+from copy import deepcopy
+
+from sqlite_utils.db import Database
+
+from arc_to_sqlite import cli, service
+
+from . import fixtures
+
+
+def test_cli(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--batch-size", "2"]
+    )
+    assert result.exit_code == 0, result.output
+    assert "1 new, 0 changed, 0 unchanged daily export files." in result.output
+
+    db = Database(db_path)
+    assert db["arc_export_files"].count == 1
+    assert db["samples"].count == 2
+
+    result = cli_runner.invoke(cli.cli, [str(db_path), str(arc_root_dir)])
+    assert result.exit_code == 0, result.output
+    assert "0 new, 0 changed, 1 unchanged daily export files." in result.output
+
+
+def test_cli__workers(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--workers", "2"]
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["arc_export_files"].count == 1
+    assert db["timeline_items"].count == 2
+    assert db["samples"].count == 2
+
+
+def test_cli__pragma_profile(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [
+            str(db_path),
+            str(arc_root_dir),
+            "--pragma-profile",
+            "fast-ingest",
+            "--bulk-load",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["samples"].count == 2
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+
+def test_cli__pragma_profile__read_optimized(
+    cli_runner, arc_root_dir, tmp_path
+):
+    result = cli_runner.invoke(
+        cli.cli,
+        [
+            str(tmp_path / "arc.db"),
+            str(arc_root_dir),
+            "--pragma-profile",
+            "read-optimized",
+        ],
+    )
+    assert result.exit_code == 2
+    assert "Invalid value for '--pragma-profile'" in result.output
+
+
+def test_cli__bulk_load__no_new_files(
+    cli_runner, arc_root_dir, tmp_path, mocker
+):
+    db_path = tmp_path / "arc.db"
+    args = [str(db_path), str(arc_root_dir), "--bulk-load"]
+
+    result = cli_runner.invoke(cli.cli, args)
+    assert result.exit_code == 0, result.output
+
+    bulk_load = mocker.spy(service, "bulk_load")
+    result = cli_runner.invoke(cli.cli, args)
+    assert result.exit_code == 0, result.output
+    assert bulk_load.call_count == 0
+
+
+def test_cli__rtree(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--rtree"]
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["samples_rtree"].count == 1
+
+
+def test_cli__partition_samples(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--partition-samples"]
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["samples_2024_05"].count == 2
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [str(db_path), str(arc_root_dir), "--partition-samples", "--rtree"],
+    )
+    assert result.exit_code == 1
+    assert "can't be used with SpatiaLite or R*Tree" in result.output
+
+
+def test_cli__compact_keys(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--compact-keys"]
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["samples"].count == 2
+    assert db["uuids"].count > 0
+
+
+def test_cli__simplified_paths(
+    cli_runner, arc_root_dir, arc_export_file_path, tmp_path
+):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli, [str(db_path), str(arc_root_dir), "--simplified-paths"]
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    row = db["timeline_items"].get(fixtures.TIMELINE_ITEM_TWO_ID)
+    assert row["samples_polyline_high"] is None
+
+    # Timeline item two's second sample got a location in Arc.
+    export = deepcopy(fixtures.DAILY_EXPORT)
+    item = export["timelineItems"][1]
+    item["lastSaved"] = "2024-05-24T09:00:00Z"
+    item["samples"][1]["location"] = dict(
+        item["samples"][0]["location"], latitude=43.65
+    )
+    with gzip.open(arc_export_file_path, "wt") as file_obj:
+        json.dump(export, file_obj)
+
+    # Without --simplified-paths, a database that has them keeps them up to
+    # date.
+    result = cli_runner.invoke(cli.cli, [str(db_path), str(arc_root_dir)])
+    assert result.exit_code == 0, result.output
+
+    row = db["timeline_items"].get(fixtures.TIMELINE_ITEM_TWO_ID)
+    assert row["samples_polyline_high"] is not None
+
+
+def test_cli__bulk_load__daily_rollups(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [str(db_path), str(arc_root_dir), "--bulk-load"],
+    )
+    assert result.exit_code == 0, result.output
+
+    db = Database(db_path)
+    assert db["daily_activity"].count == 1
+
+
+def test_cli__stats_json(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+    stats_path = tmp_path / "stats.json"
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [
+            str(db_path),
+            str(arc_root_dir),
+            "--stats-json",
+            str(stats_path),
+            "--save-stats",
+        ],
+    )
+    assert result.exit_code == 0, result.output
+    assert "save_samples" in result.output
+
+    stats = json.loads(stats_path.read_text())
+    assert list(stats["files"]) == ["2024-05-21.json.gz"]
+    assert stats["stages"]["save_samples"]["rows"] == 3
+    assert stats["files"]["2024-05-21.json.gz"] == stats["stages"]
+
+    db = Database(db_path)
+    row = next(db["arc_export_files"].rows)
+    assert json.loads(row["stats"]) == stats["stages"]
+
+
+def test_cli__profile(cli_runner, arc_root_dir, tmp_path):
+    db_path = tmp_path / "arc.db"
+    profile_path = tmp_path / "arc.prof"
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [str(db_path), str(arc_root_dir), "--profile", str(profile_path)],
+    )
+    assert result.exit_code == 0, result.output
+
+    stats = pstats.Stats(str(profile_path))
+    assert any(
+        function_name == "save_prepared_arc_export_file"
+        for _, _, function_name in stats.stats  # type: ignore[attr-defined]
+    )
+
+
+def test_cli__profile__pyinstrument_missing(
+    cli_runner, arc_root_dir, tmp_path, mocker
+):
+    mocker.patch(
+        "arc_to_sqlite.profiling.check_pyinstrument_support",
+        return_value=False,
+    )
+
+    result = cli_runner.invoke(
+        cli.cli,
+        [
+            str(tmp_path / "arc.db"),
+            str(arc_root_dir),
+            "--profile",
+            str(tmp_path / "arc.txt"),
+            "--profiler",
+            "pyinstrument",
+        ],
+    )
+    assert result.exit_code == 1
+    assert "pyinstrument isn't installed" in result.output
+
+
+def test_cli__trace_sql(cli_runner, arc_root_dir, tmp_path, caplog):
+    db_path = tmp_path / "arc.db"
+
+    with caplog.at_level(logging.DEBUG, logger="arc_to_sqlite.service.sql"):
+        result = cli_runner.invoke(
+            cli.cli, [str(db_path), str(arc_root_dir), "--trace-sql"]
+        )
+    assert result.exit_code == 0, result.output
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("INSERT INTO [samples]" in message for message in messages)
+    assert any("ms      3 rows" in message for message in messages)
+
+
+def test_migrate(cli_runner, tmp_path, mocker):
+    db_path = tmp_path / "arc.db"
+    service.build_database(service.open_database(db_path))
+    mocker.patch.object(service, "check_spatialite_support", return_value=True)
+    mocker.patch.object(service.Database, "init_spatialite")
+
+    result = cli_runner.invoke(cli.migrate, [str(db_path)])
+    assert result.exit_code == 0, result.output
+    assert "The database is already up to date." in result.output
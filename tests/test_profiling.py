@@ -0,0 +1,47 @@
+import pstats
+from types import SimpleNamespace
+
+from arc_to_sqlite import profiling
+
+
+def build_frame(function, time, children=()):
+    return SimpleNamespace(
+        function=function,
+        file_path_short="service.py",
+        line_no=1,
+        time=time,
+        children=list(children),
+    )
+
+
+def test_format_collapsed_stacks():
+    root_frame = build_frame(
+        "cli",
+        0.5,
+        [
+            build_frame("save_samples", 0.3),
+            build_frame("transform", 0.15, [build_frame("loads", 0.1)]),
+        ],
+    )
+
+    result = profiling.format_collapsed_stacks(root_frame)
+    assert result.splitlines() == [
+        "cli (service.py:1) 50",
+        "cli (service.py:1);save_samples (service.py:1) 300",
+        "cli (service.py:1);transform (service.py:1) 50",
+        "cli (service.py:1);transform (service.py:1);loads (service.py:1) 100",
+    ]
+    assert profiling.format_collapsed_stacks(None) == ""
+
+
+def test_profile(tmp_path):
+    output_path = tmp_path / "arc.prof"
+
+    with profiling.profile(output_path):
+        sorted(range(1000))
+
+    stats = pstats.Stats(str(output_path))
+    assert any(
+        function_name == "<built-in method builtins.sorted>"
+        for _, _, function_name in stats.stats  # type: ignore[attr-defined]
+    )
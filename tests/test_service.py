@@ -1,6 +1,14 @@
-from io import BytesIO
+import datetime
+import gzip
+import json
+from copy import deepcopy
+from io import BytesIO, StringIO
 
-from arc_to_sqlite import service
+import pytest
+
+from arc_to_sqlite import errors, schema, service, transformers
+
+from . import fixtures
 
 
 def test_build_database(mock_db):
@@ -55,6 +63,108 @@ def test_update_or_insert(mock_db):
     }
 
 
+def test_bulk_update_or_insert(mock_db):
+    table = mock_db.create_table(
+        name="test_bulk_update_or_insert",
+        columns={"id": str, "title": str, "tags": str},
+        pk="id",
+    )
+    table.insert({"id": "a", "title": "Old title", "tags": "existing"})
+
+    service.bulk_update_or_insert(
+        table,
+        [
+            {"id": "a", "title": "New title"},
+            {"id": "b", "title": "First"},
+            {"id": "b", "title": "Second"},
+        ],
+        pk="id",
+        create_defaults={"tags": "created"},
+    )
+    assert list(table.rows_where(order_by="id")) == [
+        {"id": "a", "title": "New title", "tags": "existing"},
+        {"id": "b", "title": "Second", "tags": "created"},
+    ]
+
+
+def test_bulk_upsert(mock_db):
+    table = mock_db.create_table(
+        name="test_bulk_upsert",
+        columns={"id": str, "title": str, "body": str, "created": str},
+        pk="id",
+    )
+    table.insert({"id": "a", "title": "Old", "body": "Body", "created": "1"})
+
+    service.bulk_upsert(
+        table,
+        [
+            {"id": "a", "title": "New", "created": "2"},
+            {"created": "2", "title": "First", "id": "b"},
+            {"id": "b", "title": "Second", "created": "3"},
+            {"id": "c", "title": "Third", "body": "Body", "created": "2"},
+        ],
+        pk="id",
+        conversions={"title": "upper(?)"},
+        insert_only=("created",),
+    )
+    assert list(table.rows_where(order_by="id")) == [
+        {"id": "a", "title": "NEW", "body": "Body", "created": "1"},
+        {"id": "b", "title": "SECOND", "body": None, "created": "3"},
+        {"id": "c", "title": "THIRD", "body": "Body", "created": "2"},
+    ]
+
+
+def test_bulk_upsert__without_on_conflict_support(mock_db, mocker):
+    table = mock_db.create_table(
+        name="test_bulk_upsert",
+        columns={"id": str, "title": str, "created": str},
+        pk="id",
+    )
+    table.insert({"id": "a", "title": "Old", "created": "1"})
+    mocker.patch.object(
+        type(mock_db),
+        "sqlite_version",
+        new_callable=mocker.PropertyMock,
+        return_value=(3, 23, 0),
+    )
+
+    service.bulk_upsert(
+        table,
+        [
+            {"id": "a", "title": "New", "created": "2"},
+            {"id": "b", "title": "First", "created": "2"},
+        ],
+        pk="id",
+        insert_only=("created",),
+    )
+    assert list(table.rows_where(order_by="id")) == [
+        {"id": "a", "title": "New", "created": "1"},
+        {"id": "b", "title": "First", "created": "2"},
+    ]
+
+
+def test_bulk_upsert_tuples(mock_db):
+    table = mock_db.create_table(
+        name="test_bulk_upsert_tuples",
+        columns={"id": str, "title": str, "created": str},
+        pk="id",
+    )
+    table.insert({"id": "a", "title": "Old", "created": "1"})
+
+    service.bulk_upsert_tuples(
+        table,
+        ("id", "title", "created"),
+        [("a", "New", "2"), ("b", "First", "2"), ("b", "Second", "3")],
+        pk="id",
+        conversions={"title": "upper(?)"},
+        insert_only=("created",),
+    )
+    assert list(table.rows_where(order_by="id")) == [
+        {"id": "a", "title": "NEW", "created": "1"},
+        {"id": "b", "title": "SECOND", "created": "2"},
+    ]
+
+
 def test_calculate_file_obj_checksum():
     file_obj = BytesIO(b"test")
 
@@ -65,6 +175,25 @@ def test_calculate_file_obj_checksum():
     )
 
 
+def test_calculate_file_checksum(tmp_path):
+    file_path = tmp_path / "test.txt"
+    file_path.write_bytes(b"test")
+
+    result = service.calculate_file_checksum(file_path)
+    assert (
+        result
+        == "9f86d081884c7d659a2feaa0c55ad015a3bf4f1b2b0b822cd15d6c15b0f00a08"
+    )
+
+    # Empty files can't be memory mapped.
+    file_path.write_bytes(b"")
+    result = service.calculate_file_checksum(file_path)
+    assert (
+        result
+        == "e3b0c44298fc1c149afbf4c8996fb92427ae41e4649b934ca495991b7852b855"
+    )
+
+
 def test_get_arc_export_file_row(mock_db):
     service.build_database(mock_db)
     table = mock_db["arc_export_files"]
@@ -82,3 +211,878 @@ def test_get_arc_export_file_row(mock_db):
     result = service.get_arc_export_file_row("2024-01-01.json.gz", table)
     assert result[0] == pk
     assert result[1]["file_name"] == "2024-01-01.json.gz"
+
+
+def test_transaction(mock_db):
+    table = mock_db.create_table("test_transaction", {"id": int}, pk="id")
+
+    with pytest.raises(RuntimeError):
+        with service.transaction(mock_db):
+            table.insert({"id": 1})
+            table.insert({"id": 2})
+            raise RuntimeError()
+
+    assert table.count == 0
+
+    with service.transaction(mock_db):
+        table.insert({"id": 1})
+        with service.transaction(mock_db):
+            table.insert({"id": 2})
+
+    assert table.count == 2
+
+
+def test_process_arc_export_file(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+    assert mock_db["arc_export_files"].count == 1
+    assert mock_db["places"].count == 2
+    assert mock_db["timeline_items"].count == 2
+    assert mock_db["samples"].count == 2
+
+
+def test_process_arc_export_file__save_stats(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, save_stats=True
+    )
+    row = next(mock_db["arc_export_files"].rows)
+    stats = json.loads(row["stats"])
+    assert list(stats) == [
+        "checksum",
+        "decode",
+        "transform",
+        "daily_rollups",
+        "save_places",
+        "save_timeline_items",
+        "save_samples",
+    ]
+    assert stats["decode"]["rows"] == 3
+    assert stats["save_samples"]["rows"] == 3
+    assert all(stage["wall"] >= 0 for stage in stats.values())
+
+
+def test_process_arc_export_file__skips_unchanged_rows(
+    mock_db, arc_export_file_path, mocker
+):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    export = deepcopy(fixtures.DAILY_EXPORT)
+    export["timelineItems"][1]["samples"][0][
+        "lastSaved"
+    ] = "2024-05-24T09:00:00Z"
+    with gzip.open(arc_export_file_path, "wt") as file_obj:
+        json.dump(export, file_obj)
+
+    save_places = mocker.spy(service, "save_places")
+    save_timeline_items = mocker.spy(service, "save_timeline_items")
+    save_samples = mocker.spy(service, "save_samples")
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    assert save_places.call_args.args[0] == []
+    assert [
+        row["item_id"] for row in save_timeline_items.call_args.args[0]
+    ] == [fixtures.TIMELINE_ITEM_TWO_ID]
+    assert [sample[0] for sample in save_samples.call_args.args[0]] == [
+        fixtures.SAMPLE_TWO_ID
+    ]
+    assert mock_db["samples"].get(fixtures.SAMPLE_TWO_ID)["last_saved_at"] == (
+        "2024-05-24T09:00:00Z"
+    )
+    assert mock_db["samples"].count == 2
+    assert mock_db["timeline_items"].count == 2
+
+
+def test_process_arc_export_file__daily_rollups__moved_timeline_item(
+    mock_db, arc_export_file_path
+):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+    assert [row["day"] for row in mock_db["daily_activity"].rows] == [
+        "2024-05-21"
+    ]
+
+    # Every timeline item was moved to the next day in Arc.
+    export = deepcopy(fixtures.DAILY_EXPORT)
+    for item in export["timelineItems"]:
+        item["startDate"] = item["startDate"].replace("05-21", "05-22")
+        item["lastSaved"] = "2024-05-24T09:00:00Z"
+    with gzip.open(arc_export_file_path, "wt") as file_obj:
+        json.dump(export, file_obj)
+
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+    assert [row["day"] for row in mock_db["daily_activity"].rows] == [
+        "2024-05-22"
+    ]
+
+
+@pytest.mark.parametrize("partition_samples", (False, True))
+def test_process_arc_export_file__deletes_stale_rows(
+    partition_samples, mock_db, arc_export_file_path
+):
+    options = {"partition_samples": partition_samples}
+    service.build_database(mock_db, **options)
+    service.process_arc_export_file(mock_db, arc_export_file_path, **options)
+    assert mock_db["samples"].count == 2
+
+    # Timeline item two was merged or deleted in Arc.
+    export = deepcopy(fixtures.DAILY_EXPORT)
+    del export["timelineItems"][1]
+    with gzip.open(arc_export_file_path, "wt") as file_obj:
+        json.dump(export, file_obj)
+
+    service.process_arc_export_file(mock_db, arc_export_file_path, **options)
+    assert [row["item_id"] for row in mock_db["timeline_items"].rows] == [
+        fixtures.TIMELINE_ITEM_ONE["itemId"]
+    ]
+    assert [row["sample_id"] for row in mock_db["samples"].rows] == [
+        fixtures.SAMPLE_ONE_ID
+    ]
+    assert mock_db["places"].count == 2
+    assert [
+        row["timeline_item_count"] for row in mock_db["daily_activity"].rows
+    ] == [1]
+
+
+def test_ingest_stats():
+    stats = service.IngestStats()
+    with stats.measure("transform", rows=2):
+        pass
+    stats.add("transform", wall=1.0, cpu=0.5, rows=3)
+
+    other = service.IngestStats()
+    other.update(stats)
+    other.add("save_samples", rows=4)
+    assert other.as_dict()["transform"]["rows"] == 5
+    assert other.as_dict()["transform"]["wall"] >= 1.0
+    assert other.as_dict()["save_samples"] == {
+        "wall": 0.0,
+        "cpu": 0.0,
+        "rows": 4,
+    }
+    assert other.as_table().splitlines()[0].split() == [
+        "stage",
+        "wall",
+        "cpu",
+        "rows",
+        "rows/s",
+    ]
+
+
+def test_process_arc_export_file__rolls_back_on_error(
+    mock_db, arc_export_file_path, mocker
+):
+    service.build_database(mock_db)
+    mocker.patch(
+        "arc_to_sqlite.service.save_samples", side_effect=RuntimeError()
+    )
+
+    with pytest.raises(RuntimeError):
+        service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    assert mock_db["arc_export_files"].count == 0
+    assert mock_db["places"].count == 0
+    assert mock_db["timeline_items"].count == 0
+
+
+def test_load_arc_export_files_index(mock_db):
+    service.build_database(mock_db)
+    table = mock_db["arc_export_files"]
+    table.insert({"file_name": "2024-01-01.json.gz", "file_checksum": "abc"})
+
+    result = service.load_arc_export_files_index(mock_db)
+    assert list(result) == ["2024-01-01.json.gz"]
+    assert result["2024-01-01.json.gz"][0] == table.last_pk
+    assert result["2024-01-01.json.gz"][1]["file_checksum"] == "abc"
+
+
+def test_plan_arc_export_file(arc_export_file_path):
+    result = service.plan_arc_export_file(arc_export_file_path)
+    assert result.status == "new"
+    assert result.arc_export_file_id is None
+    file_checksum = result.file_checksum
+
+    result = service.plan_arc_export_file(
+        arc_export_file_path,
+        arc_export_file_row=(1, {"file_checksum": file_checksum}),
+    )
+    assert result.status == "unchanged"
+    assert result.arc_export_file_id == 1
+
+    result = service.plan_arc_export_file(
+        arc_export_file_path,
+        arc_export_file_row=(1, {"file_checksum": "out-of-date"}),
+    )
+    assert result.status == "changed"
+    assert result.file_checksum == file_checksum
+
+
+def test_plan_arc_export_file__quick_check(arc_export_file_path):
+    file_stat = arc_export_file_path.stat()
+    arc_export_file_row = (
+        1,
+        {
+            "file_size": file_stat.st_size,
+            "file_mtime_ns": file_stat.st_mtime_ns,
+            "file_inode": file_stat.st_ino,
+            "file_checksum": "out-of-date",
+        },
+    )
+
+    result = service.plan_arc_export_file(
+        arc_export_file_path,
+        arc_export_file_row=arc_export_file_row,
+        quick_check=True,
+    )
+    assert result.status == "unchanged"
+    assert result.file_checksum is None
+
+    result = service.plan_arc_export_file(
+        arc_export_file_path, arc_export_file_row=arc_export_file_row
+    )
+    assert result.status == "changed"
+
+
+def test_update_arc_export_file_signatures(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+    mock_db["arc_export_files"].update(
+        1, {"file_mtime_ns": None, "file_inode": None}
+    )
+
+    index = service.load_arc_export_files_index(mock_db)
+    plans = list(service.plan_arc_export_files([arc_export_file_path], index))
+    assert plans[0].status == "unchanged"
+    assert plans[0].file_checksum is not None
+
+    result = service.update_arc_export_file_signatures(mock_db, plans, index)
+    assert result == 1
+
+    index = service.load_arc_export_files_index(mock_db)
+    plans = list(
+        service.plan_arc_export_files(
+            [arc_export_file_path], index, quick_check=True
+        )
+    )
+    assert plans[0].status == "unchanged"
+    assert plans[0].file_checksum is None
+    assert service.update_arc_export_file_signatures(mock_db, plans, index) == 0
+
+
+def test_prepare_arc_export_file(arc_export_file_path):
+    plan = service.plan_arc_export_file(arc_export_file_path)
+
+    result = service.prepare_arc_export_file(plan)
+    assert result.plan == plan
+    assert len(result.batches) == 1
+    assert len(result.batches[0].places) == 3
+    assert len(result.batches[0].timeline_items) == 3
+    assert len(result.batches[0].samples) == 3
+
+
+@pytest.mark.parametrize("workers", (1, 2))
+def test_plan_and_prepare_arc_export_files(workers, arc_root_dir):
+    daily_path = arc_root_dir / "Documents/Export/JSON/Daily"
+    file_paths = []
+    for day in range(1, 6):
+        file_path = daily_path / f"2024-06-0{day}.json.gz"
+        file_path.write_bytes((daily_path / "2024-05-21.json.gz").read_bytes())
+        file_paths.append(file_path)
+
+    plans = list(service.plan_arc_export_files(file_paths, {}, workers=workers))
+    assert [plan.file_path for plan in plans] == file_paths
+    assert all(plan.status == "new" for plan in plans)
+
+    result = list(service.prepare_arc_export_files(plans, workers=workers))
+    assert [prepared.plan for prepared in result] == plans
+    assert all(
+        sum(len(batch.samples) for batch in prepared.batches) == 3
+        for prepared in result
+    )
+
+
+@pytest.mark.parametrize("chunk_size", (1, 7, 64 * 1024))
+def test_iter_arc_export_timeline_items(chunk_size):
+    document = json.dumps(
+        {
+            "version": 1.5,
+            "timelineItems": [
+                fixtures.TIMELINE_ITEM_ONE,
+                {"stepCount": 12345},
+                fixtures.TIMELINE_ITEM_FOUR,
+            ],
+            "exportedAt": 12345,
+        },
+        indent=2,
+    )
+
+    result = list(
+        service.iter_arc_export_timeline_items(
+            StringIO(document), chunk_size=chunk_size
+        )
+    )
+    assert result == [
+        fixtures.TIMELINE_ITEM_ONE,
+        {"stepCount": 12345},
+        fixtures.TIMELINE_ITEM_FOUR,
+    ]
+
+
+@pytest.mark.parametrize(
+    "document", ('{"timelineItems": [{"stepCount": 1}', "[]", "")
+)
+def test_iter_arc_export_timeline_items__invalid(document):
+    with pytest.raises(json.JSONDecodeError):
+        list(service.iter_arc_export_timeline_items(StringIO(document)))
+
+
+def test_iter_arc_export_file_batches(arc_export_file_path):
+    result = list(
+        service.iter_arc_export_file_batches(arc_export_file_path, batch_size=2)
+    )
+    assert [len(batch.timeline_items) for batch in result] == [2, 1]
+    assert [len(batch.samples) for batch in result] == [3, 0]
+
+
+def test_transform_arc_export_batch__use_spatialite():
+    timeline_items = [
+        deepcopy(fixtures.TIMELINE_ITEM_ONE),
+        deepcopy(fixtures.TIMELINE_ITEM_TWO),
+    ]
+    timeline_items[0]["samples"] = []
+    timeline_items[1]["samples"] = [
+        deepcopy(fixtures.SAMPLE_ONE),
+        deepcopy(fixtures.SAMPLE_TWO),
+    ]
+
+    result = service.transform_arc_export_batch(
+        timeline_items, use_spatialite=True
+    )
+
+    sample_columns = transformers.get_sample_tuple_columns(True)
+    sample_rows = [dict(zip(sample_columns, row)) for row in result.samples]
+    assert [row["coordinates"] for row in sample_rows] == (
+        transformers.convert_coordinates_to_wkb_points(
+            (sample["location"]["latitude"], sample["location"]["longitude"])
+            for sample in (fixtures.SAMPLE_ONE, fixtures.SAMPLE_TWO)
+        )
+    )
+    centers = [item["center"] for item in timeline_items]
+    assert [row["coordinates"] for row in result.timeline_items] == (
+        transformers.convert_coordinates_to_wkb_points(
+            (center["latitude"], center["longitude"]) for center in centers
+        )
+    )
+    assert result.timeline_items[0]["samples_path"] is None
+    assert result.timeline_items[1]["samples_path"] == (
+        transformers.convert_coordinates_to_wkb_line_strings(
+            [[(row["latitude"], row["longitude"]) for row in sample_rows]]
+        )[0]
+    )
+
+
+def test_build_database__schema_version(mock_db):
+    service.build_database(mock_db)
+    assert service.get_schema_version(mock_db) == schema.SCHEMA_VERSION
+
+
+def test_build_database__migration_required(mock_db):
+    service.build_database(mock_db)
+    mock_db["samples"].add_column("coordinates", str)
+    service.set_schema_version(mock_db, 0)
+
+    with pytest.raises(errors.DatabaseMigrationRequiredError):
+        service.build_database(mock_db, use_spatialite=True)
+
+    # Without SpatiaLite no geometries are added, so it's left to migrate.
+    service.build_database(mock_db)
+    assert service.get_schema_version(mock_db) == 0
+
+
+def test_migrate_database(mock_db):
+    service.build_database(mock_db)
+    mock_db["samples"].add_column("coordinates", str)
+    mock_db["samples"].insert_all(
+        [
+            {"sample_id": "a", "coordinates": "43.6 -79.4"},
+            {"sample_id": "b", "coordinates": None},
+        ]
+    )
+    mock_db.execute("CREATE TABLE idx_samples_coordinates (pkid INTEGER)")
+    service.set_schema_version(mock_db, 0)
+
+    # Stand-ins for the SpatiaLite functions the migration uses.
+    calls = []
+    mock_db.conn.create_function(
+        "SwapCoordinates", 1, lambda value: " ".join(value.split()[::-1])
+    )
+    for name in ("DisableSpatialIndex", "CreateSpatialIndex"):
+        mock_db.conn.create_function(
+            name, 2, lambda *args, name=name: calls.append((name, *args))
+        )
+
+    assert service.migrate_database(mock_db) == [1]
+    assert service.get_schema_version(mock_db) == 1
+    assert [row["coordinates"] for row in mock_db["samples"].rows] == [
+        "-79.4 43.6",
+        None,
+    ]
+    assert calls == [
+        ("DisableSpatialIndex", "samples", "coordinates"),
+        ("CreateSpatialIndex", "samples", "coordinates"),
+    ]
+
+    assert service.migrate_database(mock_db) == []
+
+
+def test_create_rtree_index(mock_db, arc_export_file_path):
+    service.build_database(mock_db, use_rtree=True)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    result = service.query_bounding_box(
+        mock_db,
+        "samples",
+        min_latitude=43.64,
+        min_longitude=-79.43,
+        max_latitude=43.65,
+        max_longitude=-79.41,
+    )
+    assert sorted(row["sample_id"] for row in result) == sorted(
+        row["sample_id"]
+        for row in mock_db["samples"].rows_where("latitude IS NOT NULL")
+    )
+
+    sample = fixtures.TRANSFORMED_SAMPLE_TWO
+    result = service.query_radius(
+        mock_db,
+        "samples",
+        latitude=sample["latitude"],
+        longitude=sample["longitude"],
+        radius=100,
+    )
+    assert [row["sample_id"] for row in result] == [sample["sample_id"]]
+
+    # The triggers keep the index up to date.
+    mock_db["samples"].update(sample["sample_id"], {"latitude": 10.0})
+    result = service.query_radius(
+        mock_db,
+        "samples",
+        latitude=sample["latitude"],
+        longitude=sample["longitude"],
+        radius=100,
+    )
+    assert list(result) == []
+
+
+def test_create_rtree_index__existing_rows(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    service.build_database(mock_db, use_rtree=True)
+    assert mock_db["places_rtree"].count == mock_db["places"].count
+
+
+def test_calculate_distance():
+    # Toronto's CN Tower to Nathan Phillips Square.
+    result = service.calculate_distance(43.6426, -79.3871, 43.6525, -79.3839)
+    assert result == pytest.approx(1128, rel=0.01)
+
+
+def test_transform_arc_export_batch__use_distances():
+    timeline_items = [
+        deepcopy(fixtures.TIMELINE_ITEM_TWO),
+        deepcopy(fixtures.TIMELINE_ITEM_ONE),
+    ]
+    timeline_items[0]["samples"] = [
+        deepcopy(fixtures.SAMPLE_ONE),
+        deepcopy(fixtures.SAMPLE_TWO),
+    ]
+    timeline_items[1]["samples"] = []
+
+    result = service.transform_arc_export_batch(deepcopy(timeline_items))
+    assert "distance" not in result.timeline_items[0]
+
+    result = service.transform_arc_export_batch(
+        timeline_items, use_distances=True
+    )
+    assert result.timeline_items[0]["distance"] == pytest.approx(
+        service.calculate_distance(
+            fixtures.SAMPLE_ONE["location"]["latitude"],
+            fixtures.SAMPLE_ONE["location"]["longitude"],
+            fixtures.SAMPLE_TWO["location"]["latitude"],
+            fixtures.SAMPLE_TWO["location"]["longitude"],
+        )
+    )
+    assert result.timeline_items[1]["distance"] is None
+
+
+def test_transform_arc_export_batch__use_simplified_paths():
+    timeline_items = [
+        deepcopy(fixtures.TIMELINE_ITEM_ONE),
+        deepcopy(fixtures.TIMELINE_ITEM_TWO),
+    ]
+    timeline_items[0]["samples"] = []
+    timeline_items[1]["samples"] = [
+        deepcopy(fixtures.SAMPLE_ONE),
+        deepcopy(fixtures.SAMPLE_TWO),
+    ]
+
+    result = service.transform_arc_export_batch(
+        timeline_items, use_simplified_paths=True
+    )
+
+    expected_polyline = transformers.encode_polyline(
+        [
+            (sample["latitude"], sample["longitude"])
+            for sample in (
+                fixtures.TRANSFORMED_SAMPLE_ONE,
+                fixtures.TRANSFORMED_SAMPLE_TWO,
+            )
+        ]
+    )
+    for column in schema.SIMPLIFIED_PATH_TOLERANCES:
+        assert result.timeline_items[0][column] is None
+        assert result.timeline_items[1][column] == expected_polyline
+
+
+def test_process_arc_export_file__simplified_paths(
+    mock_db, arc_export_file_path
+):
+    service.build_database(mock_db, use_simplified_paths=True)
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, use_simplified_paths=True
+    )
+
+    columns = mock_db["timeline_items"].columns_dict
+    assert set(schema.SIMPLIFIED_PATH_TOLERANCES) <= set(columns)
+
+
+def test_process_arc_export_file__partition_samples(
+    mock_db, arc_export_file_path
+):
+    service.build_database(mock_db, partition_samples=True)
+    assert service.is_samples_partitioned(mock_db)
+    assert mock_db["samples"].count == 0
+
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, partition_samples=True
+    )
+
+    assert service.get_samples_partition_names(mock_db) == ["samples_2024_05"]
+    assert mock_db["samples_2024_05"].count == 2
+    assert mock_db["samples"].count == 2
+    assert list(mock_db["arc_export_file_samples_partitions"].rows) == [
+        {"arc_export_file_id": 1, "table_name": "samples_2024_05"}
+    ]
+
+    # It stays partitioned without asking for it again.
+    service.build_database(mock_db)
+    assert service.is_samples_partitioned(mock_db)
+
+
+def test_build_database__partition_samples_errors(mock_db):
+    service.build_database(mock_db)
+    with pytest.raises(errors.IncompatibleOptionsError):
+        service.build_database(mock_db, partition_samples=True)
+
+
+def test_build_database__partition_samples_rtree(mock_db):
+    with pytest.raises(errors.IncompatibleOptionsError):
+        service.build_database(mock_db, partition_samples=True, use_rtree=True)
+
+
+@pytest.mark.parametrize(
+    "taken_at, expected_result",
+    (
+        ("2024-05-21T17:25:47Z", "samples_2024_05"),
+        (None, "samples_undated"),
+    ),
+)
+def test_get_samples_partition_name(taken_at, expected_result):
+    assert service.get_samples_partition_name(taken_at) == expected_result
+
+
+def test_process_arc_export_file__compact_keys(mock_db, arc_export_file_path):
+    service.build_database(mock_db, compact_keys=True)
+    assert mock_db["samples"].columns_dict["sample_id"] is int
+
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, compact_keys=True
+    )
+    # Saving it again maps the UUIDs to the same ids.
+    mock_db["arc_export_files"].delete_where()
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, compact_keys=True
+    )
+
+    assert mock_db["samples"].count == 2
+    assert mock_db["timeline_items"].count == 2
+    assert mock_db["places"].count == 2
+
+    rows = mock_db.execute(
+        "SELECT uuids.uuid FROM samples "
+        "JOIN uuids ON uuids.id = samples.sample_id "
+        "ORDER BY uuids.uuid"
+    ).fetchall()
+    assert [row[0] for row in rows] == sorted(
+        {
+            fixtures.TRANSFORMED_SAMPLE_ONE["sample_id"],
+            fixtures.TRANSFORMED_SAMPLE_TWO["sample_id"],
+        }
+    )
+
+    # The foreign keys use the same ids.
+    joined = mock_db.execute(
+        "SELECT count(*) FROM samples "
+        "JOIN timeline_items ON timeline_items.item_id = "
+        "samples.timeline_item_id"
+    ).fetchone()[0]
+    assert joined == 2
+
+
+def test_build_database__compact_keys_errors(mock_db):
+    service.build_database(mock_db)
+    with pytest.raises(errors.IncompatibleOptionsError):
+        service.build_database(mock_db, compact_keys=True)
+
+
+def test_get_uuid_ids(mock_db):
+    service.build_database(mock_db, compact_keys=True)
+
+    first = service.get_uuid_ids(mock_db, ["a", "b", None, "a"])
+    assert set(first) == {"a", "b"}
+
+    second = service.get_uuid_ids(mock_db, ["b", "c"])
+    assert second["b"] == first["b"]
+    assert mock_db["uuids"].count == 3
+
+
+def test_process_arc_export_file__date_columns(mock_db, arc_export_file_path):
+    service.build_database(mock_db, date_columns=True)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    rows = mock_db.execute(
+        "SELECT starts_at, seconds_from_gmt, starts_at_epoch, starts_on "
+        "FROM timeline_items ORDER BY starts_at"
+    ).fetchall()
+    for starts_at, seconds_from_gmt, starts_at_epoch, starts_on in rows:
+        started_at = datetime.datetime.fromisoformat(starts_at)
+        assert starts_at_epoch == int(started_at.timestamp())
+        assert (
+            starts_on
+            == (started_at + datetime.timedelta(seconds=seconds_from_gmt))
+            .date()
+            .isoformat()
+        )
+
+    query_plan = mock_db.execute(
+        "EXPLAIN QUERY PLAN SELECT taken_on, count(*) FROM samples "
+        "WHERE taken_on >= '2024-05-01' GROUP BY taken_on"
+    ).fetchall()
+    assert "idx_samples_taken_on" in query_plan[0][3]
+
+
+def test_build_database__date_expression_indexes(mock_db):
+    service.build_database(mock_db)
+
+    expression = schema.TABLE_DATE_COLUMNS["timeline_items"]["starts_on"][1]
+    query_plan = mock_db.execute(
+        "EXPLAIN QUERY PLAN SELECT latitude, longitude FROM timeline_items "
+        f"WHERE {expression} >= '2024-05-01'"
+    ).fetchall()
+    assert "idx_timeline_items_starts_on_expr" in query_plan[0][3]
+
+
+def test_build_database__date_columns_partition_samples(
+    mock_db, arc_export_file_path
+):
+    service.build_database(mock_db, partition_samples=True, date_columns=True)
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, partition_samples=True
+    )
+
+    result = mock_db.execute("SELECT DISTINCT taken_on FROM samples")
+    assert [row[0] for row in result] == ["2024-05-21"]
+
+
+def test_transform_arc_export_batch__seconds_from_gmt():
+    timeline_items = [
+        deepcopy(fixtures.TIMELINE_ITEM_ONE),
+        deepcopy(fixtures.TIMELINE_ITEM_TWO),
+    ]
+    timeline_items[1].pop("place", None)
+    timeline_items[1]["samples"] = [deepcopy(fixtures.SAMPLE_TWO)]
+
+    result = service.transform_arc_export_batch(timeline_items)
+    assert [row["seconds_from_gmt"] for row in result.timeline_items] == [
+        fixtures.PLACE_ONE["secondsFromGMT"],
+        fixtures.SAMPLE_TWO["secondsFromGMT"],
+    ]
+
+
+def test_process_arc_export_file__daily_rollups(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    expected_rows = list(
+        mock_db.query(
+            "SELECT date(starts_at, seconds_from_gmt || ' seconds') AS day, "
+            "count(*) AS timeline_item_count, sum(step_count) AS step_count "
+            "FROM timeline_items GROUP BY day"
+        )
+    )
+    assert expected_rows
+    assert [
+        {
+            "day": row["day"],
+            "timeline_item_count": row["timeline_item_count"],
+            "step_count": row["step_count"],
+        }
+        for row in mock_db["daily_activity"].rows
+    ] == expected_rows
+
+    visits = mock_db.execute(
+        "SELECT count(*) FROM timeline_items WHERE is_visit"
+    ).fetchone()[0]
+    assert (
+        sum(row["visit_count"] for row in mock_db["daily_place_visits"].rows)
+        == visits
+    )
+
+
+def test_update_daily_rollups(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    # The rollups of a database from before they existed are filled in from
+    # what is already saved.
+    mock_db["daily_place_visits"].drop()
+    mock_db["daily_activity"].drop()
+    service.build_database(mock_db)
+    (row,) = mock_db["daily_activity"].rows
+    assert row["timeline_item_count"] == 2
+
+    mock_db["timeline_items"].update(
+        fixtures.TRANSFORMED_TIMELINE_ITEM_ONE["item_id"], {"step_count": 0}
+    )
+    service.update_daily_rollups(mock_db, ["2000-01-01"])
+    assert mock_db["daily_activity"].get(row["day"]) == row
+
+    service.update_daily_rollups(mock_db, [row["day"]])
+    assert mock_db["daily_activity"].get(row["day"]) != row
+
+
+def test_calculate_path_distance():
+    result = service.calculate_path_distance(
+        [
+            (43.6426, -79.3871),
+            (None, None),
+            (43.6525, -79.3839),
+            (43.6525, -79.3839),
+        ]
+    )
+    assert result == pytest.approx(1128, rel=0.01)
+
+
+def test_bulk_load(mock_db, arc_export_file_path):
+    service.build_database(mock_db)
+
+    with service.bulk_load(mock_db):
+        assert [i.origin for i in mock_db["samples"].indexes] == ["pk"]
+        assert mock_db["places"].triggers == []
+
+        service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    assert {tuple(index.columns) for index in mock_db["samples"].indexes} == {
+        ("sample_id",),
+        ("timeline_item_id",),
+        ("taken_at",),
+        ("longitude",),
+        ("latitude",),
+        ("arc_export_file_id",),
+    }
+    assert len(mock_db["places"].triggers) == 3
+    assert mock_db["places_fts"].count == 2
+
+
+def test_bulk_load__rtree(mock_db, arc_export_file_path):
+    service.build_database(mock_db, use_rtree=True)
+
+    with service.bulk_load(mock_db):
+        assert mock_db["samples"].triggers == []
+        service.process_arc_export_file(mock_db, arc_export_file_path)
+        assert mock_db["samples_rtree"].count == 0
+
+    assert len(mock_db["samples"].triggers) == 3
+    assert mock_db["samples_rtree"].count == mock_db["samples"].count_where(
+        "latitude IS NOT NULL"
+    )
+
+
+def test_build_database__interrupted_bulk_load(mock_db, arc_export_file_path):
+    service.build_database(mock_db, use_rtree=True)
+
+    # The process is killed before the bulk load finishes.
+    bulk_load = service.bulk_load(mock_db)
+    bulk_load.__enter__()
+    service.process_arc_export_file(mock_db, arc_export_file_path)
+    assert mock_db["places"].triggers == []
+    assert mock_db["samples"].triggers == []
+
+    service.build_database(mock_db)
+    assert len(mock_db["places"].triggers) == 6
+    assert len(mock_db["samples"].triggers) == 3
+    assert list(mock_db["places"].search("Squirrel")) != []
+    assert mock_db["samples_rtree"].count == mock_db["samples"].count_where(
+        "latitude IS NOT NULL"
+    )
+
+
+def test_bulk_load__partition_samples(mock_db, arc_export_file_path):
+    service.build_database(mock_db, partition_samples=True)
+    service.process_arc_export_file(
+        mock_db, arc_export_file_path, partition_samples=True
+    )
+
+    with service.bulk_load(mock_db):
+        assert [i.origin for i in mock_db["samples_2024_05"].indexes] == ["pk"]
+
+    assert len(mock_db["samples_2024_05"].indexes) == 6
+
+
+def test_bulk_load__date_columns(mock_db, arc_export_file_path):
+    service.build_database(mock_db, date_columns=True)
+
+    with service.bulk_load(mock_db):
+        assert [i.origin for i in mock_db["samples"].indexes] == ["pk"]
+        service.process_arc_export_file(mock_db, arc_export_file_path)
+
+    assert ("taken_on",) in {
+        tuple(index.columns) for index in mock_db["samples"].indexes
+    }
+    assert list(mock_db["places"].search("Squirrel")) != []
+
+
+def test_open_database__pragma_profile(tmp_path):
+    db = service.open_database(
+        tmp_path / "arc.db", pragma_profile="fast-ingest"
+    )
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 0
+    assert db.execute("PRAGMA page_size").fetchone()[0] == 16384
+
+    service.finish_pragma_profile(db, "fast-ingest")
+    assert db.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 2
+
+
+def test_open_database__pragma_profile__read_optimized(tmp_path):
+    db = service.open_database(
+        tmp_path / "arc.db", pragma_profile="read-optimized"
+    )
+    assert db.execute("PRAGMA synchronous").fetchone()[0] == 1
+    assert db.execute("PRAGMA cache_size").fetchone()[0] == -64 * 1024
+    assert db.execute("PRAGMA temp_store").fetchone()[0] == 2
@@ -3,6 +3,7 @@ from copy import deepcopy
 from pathlib import Path
 
 import pytest
+import shapely
 from freezegun import freeze_time
 
 from arc_to_sqlite import transformers
@@ -10,54 +11,62 @@ from arc_to_sqlite import transformers
 from . import fixtures
 
 
-@pytest.mark.parametrize(
-    "latitude, longitude, expected_result",
-    (("37.7749", "-122.4194", "POINT (37.7749 -122.4194)"),),
-)
-def test_convert_coordinates_to_wkt_point(latitude, longitude, expected_result):
-    result = transformers.convert_coordinates_to_wkt_point(
-        latitude=latitude,
-        longitude=longitude,
+def test_convert_coordinates_to_wkb_points():
+    result = transformers.convert_coordinates_to_wkb_points(
+        [("37.7749", "-122.4194"), (None, None), (37.773, -122.419)]
     )
-    assert result == expected_result
+    assert [shapely.from_wkb(wkb).wkt if wkb else wkb for wkb in result] == [
+        "POINT (-122.4194 37.7749)",
+        None,
+        "POINT (-122.419 37.773)",
+    ]
+
+
+def test_convert_coordinates_to_wkb_line_strings():
+    result = transformers.convert_coordinates_to_wkb_line_strings(
+        [
+            [("37.7749", "-122.4194"), (None, None), (37.773, -122.419)],
+            [(37.7749, -122.4194)],
+            [],
+            [(1, 2), (3, 4), (5, 6)],
+        ]
+    )
+    assert [shapely.from_wkb(wkb).wkt if wkb else wkb for wkb in result] == [
+        "LINESTRING (-122.4194 37.7749, -122.419 37.773)",
+        None,
+        None,
+        "LINESTRING (2 1, 4 3, 6 5)",
+    ]
 
 
 @pytest.mark.parametrize(
-    "samples, expected_result",
+    "name, expected_result",
     (
-        (
-            [
-                {"location": {"latitude": "37.7749", "longitude": "-122.4194"}},
-                {},
-                {"location": {}},
-                {"location": {"latitude": "37.7730", "longitude": "-122.4190"}},
-            ],
-            "LINESTRING (37.7749 -122.4194, 37.773 -122.419)",
-        ),
-        (
-            [{"location": {"latitude": "37.7749", "longitude": "-122.4194"}}],
-            None,
-        ),
-        ([], None),
+        ("street_address", "streetAddress"),
+        ("streetAddress", "streetAddress"),
+        ("activity_type_confidence_score", "activityTypeConfidenceScore"),
     ),
 )
-def test_convert_samples_to_wkt_line_string(samples, expected_result):
-    result = transformers.convert_samples_to_wkt_line_string(samples)
+def test_convert_to_camel_case(name, expected_result):
+    result = transformers.convert_to_camel_case(name)
     assert result == expected_result
 
 
-@pytest.mark.parametrize(
-    "name, expected_result",
-    (
-        ("streetAddress", "street_address"),
-        ("street_address", "street_address"),
-        ("nameWithACRONYM", "name_with_acronym"),
-        ("1Abc2", "1_abc2"),
-    ),
-)
-def test_convert_to_snake_case(name, expected_result):
-    result = transformers.convert_to_snake_case(name)
-    assert result == expected_result
+def test_build_key_mapping():
+    result = transformers.build_key_mapping(
+        ["place_id", "last_saved_at", "latitude", "radius_sd"],
+        renames={"last_saved_at": "lastSaved"},
+        nested={
+            "center": ("", ["latitude"]),
+            "radius": ("radius_", ["radius_sd"]),
+        },
+    )
+    assert result == {
+        "placeId": "place_id",
+        "lastSaved": "last_saved_at",
+        "center": {"latitude": "latitude"},
+        "radius": {"sd": "radius_sd"},
+    }
 
 
 @pytest.mark.parametrize(
@@ -74,15 +83,6 @@ def test_transform_place(place, expected_result):
     assert result == expected_result
 
 
-def test_transform_place__use_spatialite():
-    place = deepcopy(fixtures.PLACE_ONE)
-    result = transformers.transform_place(place, use_spatialite=True)
-    assert (
-        result["coordinates"]
-        == f"POINT ({place['latitude']} {place['longitude']})"
-    )
-
-
 @pytest.mark.parametrize(
     "sample, expected_result",
     (
@@ -97,15 +97,6 @@ def test_transform_sample(sample, expected_result):
     assert result == expected_result
 
 
-def test_transform_sample__use_spatialite():
-    sample = deepcopy(fixtures.SAMPLE_ONE)
-    result = transformers.transform_sample(sample, use_spatialite=True)
-    assert (
-        result["coordinates"]
-        == f"POINT ({sample['latitude']} {sample['longitude']})"
-    )
-
-
 @pytest.mark.parametrize(
     "timeline_item, expected_result",
     (
@@ -124,13 +115,19 @@ def test_transform_timeline_item(timeline_item, expected_result):
     assert result == expected_result
 
 
-def test_transform_timeline_item__use_spatialite():
-    item = deepcopy(fixtures.TIMELINE_ITEM_ONE)
-    result = transformers.transform_timeline_item(item, use_spatialite=True)
-    assert (
-        result["coordinates"]
-        == f"POINT ({item['latitude']} {item['longitude']})"
-    )
+@pytest.mark.parametrize(
+    "sample, expected_result",
+    (
+        (fixtures.SAMPLE_ONE, fixtures.TRANSFORMED_SAMPLE_ONE),
+        (fixtures.SAMPLE_THREE, fixtures.TRANSFORMED_SAMPLE_THREE),
+    ),
+)
+def test_transform_sample_to_tuple(sample, expected_result):
+    result = transformers.transform_sample_to_tuple(deepcopy(sample))
+    columns = transformers.get_sample_tuple_columns()
+    assert dict(zip(columns, result)) == {
+        column: expected_result.get(column) for column in columns
+    }
 
 
 @freeze_time("2024-01-01")
@@ -160,7 +157,9 @@ def test_transform_arc_export_file_path(
 
     mocker.patch(
         "arc_to_sqlite.transformers.Path.stat",
-        return_value=mocker.Mock(st_size=expected_file_size),
+        return_value=mocker.Mock(
+            st_size=expected_file_size, st_mtime_ns=1704067200, st_ino=42
+        ),
     )
 
     result = transformers.transform_arc_export_file_path(
@@ -171,6 +170,8 @@ def test_transform_arc_export_file_path(
         "file_name": path.name,
         "file_path": str(path.absolute()),
         "file_size": expected_file_size,
+        "file_mtime_ns": 1704067200,
+        "file_inode": 42,
         "file_checksum": expected_file_checksum,
         "export_type": expected_export_type,
         "last_processed_at": expected_last_processed_at,